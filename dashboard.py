@@ -4,8 +4,22 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import io
+import os
+import sys
 from datetime import datetime
 
+# Shared pipeline helpers live alongside the analysis scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "notebooks"))
+from data_access import read_upload
+from cube import build_cube, district_totals, load_cube
+from districts import KEY, attach_names, dimension_from, join_on_keys
+from segments import Segments
+
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+
+# Columns the three frameworks use; nothing else is read from uploads
+LOAD_COLUMNS = ['state', 'district', 'date', 'age_0_5', 'age_5_17', 'age_18_plus']
+
 # Page config
 st.set_page_config(
     page_title="UIDAI Operational Intelligence Dashboard",
@@ -50,6 +64,10 @@ with st.sidebar:
     enrolment_file = st.file_uploader("Enrolment Data", type=['csv'], key='enrolment')
     demographic_file = st.file_uploader("Demographic Updates", type=['csv'], key='demographic')
     biometric_file = st.file_uploader("Biometric Updates", type=['csv'], key='biometric')
+
+    st.markdown("Or use the pipeline's daily aggregate cube directly (no upload or parsing):")
+    use_pipeline_cube = st.checkbox("Use pipeline cube", value=False)
+    store_root = st.text_input("Cleaned data folder", CLEANED_DIR, disabled=not use_pipeline_cube)
     
     st.markdown("---")
     st.markdown("### 📊 Framework Modules")
@@ -62,28 +80,38 @@ with st.sidebar:
 
 # Helper Functions
 @st.cache_data
-def load_and_validate_csv(file):
-    """Load and validate CSV file"""
+def load_and_validate_csv(file, category):
+    """Load and validate CSV file, cast to the pipeline's typed schema"""
     try:
-        df = pd.read_csv(file)
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'])
+        df = read_upload(file, category, columns=LOAD_COLUMNS)
         return df, None
     except Exception as e:
         return None, str(e)
 
 
-def calculate_uesi(enrolment_df, demographic_df):
+@st.cache_resource
+def load_pipeline_cube(cleaned_dir):
+    """
+    The daily aggregate cube of the pipeline's masters (read-only, canonical
+    geography as in 07/10); shared across sessions
+    """
+    try:
+        cube = load_cube(canonical=True, cleaned_dir=cleaned_dir)
+    except Exception as e:
+        return None, str(e)
+    if len(cube) == 0:
+        return None, f"No masters in {cleaned_dir} (run the pipeline first)"
+    return cube, None
+
+
+def calculate_uesi(cube):
     """Calculate UESI scores"""
     # Aggregate adult data
-    enrol_adult = enrolment_df.groupby(['state', 'district'])['age_18_plus'].sum().reset_index()
-    enrol_adult.rename(columns={'age_18_plus': 'total_adult_enrolments'}, inplace=True)
-    
-    demo_adult = demographic_df.groupby(['state', 'district'])['age_18_plus'].sum().reset_index()
-    demo_adult.rename(columns={'age_18_plus': 'total_adult_updates'}, inplace=True)
+    enrol_adult = district_totals(cube, ['Enrolment'], ['age_18_plus']).rename('total_adult_enrolments').reset_index()
+    demo_adult = district_totals(cube, ['Demographic'], ['age_18_plus']).rename('total_adult_updates').reset_index()
     
-    # Merge
-    merged = pd.merge(enrol_adult, demo_adult, on=['state', 'district'], how='inner')
+    # Merge on the district key
+    merged = join_on_keys(enrol_adult, demo_adult)
     merged = merged[merged['total_adult_enrolments'] > 100]
     
     # Calculate UESI
@@ -94,52 +122,38 @@ def calculate_uesi(enrolment_df, demographic_df):
     max_val = merged['uesi_raw'].max()
     merged['UESI_Score'] = ((merged['uesi_raw'] - min_val) / (max_val - min_val)) * 100
     
-    return merged.sort_values('UESI_Score', ascending=False)
+    merged = merged.sort_values('UESI_Score', ascending=False)
+    return attach_names(merged, dimension_from(cube), keep_key=True)
 
 
-def calculate_resilience(enrolment_df, demographic_df, biometric_df):
+def calculate_resilience(cube):
     """Calculate Operational Resilience metrics"""
-    # Combine all data sources for daily volume
-    all_dfs = []
+    # Daily volume per district across all data sources
+    district_daily = district_totals(cube, daily=True).rename('total_volume').reset_index()
     
-    for df, name in [(enrolment_df, 'Enrolment'), (demographic_df, 'Demographic'), (biometric_df, 'Biometric')]:
-        age_cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-        available_cols = [col for col in age_cols if col in df.columns]
-        df_copy = df.copy()
-        df_copy['total_volume'] = df_copy[available_cols].sum(axis=1)
-        daily = df_copy.groupby(['state', 'district', 'date'])['total_volume'].sum().reset_index()
-        all_dfs.append(daily)
+    # Metrics per district, reduced over each district's sorted segment of the series
+    district_daily = district_daily.sort_values([KEY, 'date'], kind='stable')
+    volumes = district_daily['total_volume'].to_numpy(dtype='float64')
+    districts = Segments(district_daily[KEY].to_numpy())
     
-    # Combine and aggregate
-    combined = pd.concat(all_dfs, ignore_index=True)
-    district_daily = combined.groupby(['state', 'district', 'date'])['total_volume'].sum().reset_index()
+    median_vol = districts.median(volumes)
+    peak_vol = districts.max(volumes)
+    mean_vol = districts.mean(volumes)
+    std_vol = districts.std(volumes, mean_vol)
     
-    # Calculate metrics per district
-    results = []
-    for (state, district), group in district_daily.groupby(['state', 'district']):
-        volumes = group['total_volume'].values
-        
-        if len(volumes) < 10:
-            continue
-        
-        median_vol = np.median(volumes)
-        peak_vol = np.max(volumes)
-        std_vol = np.std(volumes)
-        mean_vol = np.mean(volumes)
-        
-        shock_intensity = peak_vol / median_vol if median_vol > 0 else 0
-        volatility_score = (std_vol / mean_vol * 100) if mean_vol > 0 else 0
-        
-        results.append({
-            'state': state,
-            'district': district,
-            'shock_intensity': shock_intensity,
-            'volatility_score': volatility_score,
-            'median_daily_volume': median_vol,
-            'peak_daily_volume': peak_vol
-        })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shock_intensity = np.where(median_vol > 0, peak_vol / median_vol, 0)
+        volatility_score = np.where(mean_vol > 0, std_vol / mean_vol * 100, 0)
     
-    df = pd.DataFrame(results)
+    results = pd.DataFrame({
+        KEY: districts.keys,
+        'shock_intensity': shock_intensity,
+        'volatility_score': volatility_score,
+        'median_daily_volume': median_vol,
+        'peak_daily_volume': peak_vol
+    })[districts.counts >= 10]
+    
+    df = attach_names(results.reset_index(drop=True), dimension_from(cube), keep_key=True)
     
     # Classify into tiers
     shock_95 = df['shock_intensity'].quantile(0.95)
@@ -164,11 +178,9 @@ def calculate_resilience(enrolment_df, demographic_df, biometric_df):
 
 def create_archetypes(uesi_df, resilience_df):
     """Create district archetypes"""
-    merged = pd.merge(
-        uesi_df[['state', 'district', 'UESI_Score']],
-        resilience_df[['state', 'district', 'shock_intensity', 'resilience_tier']],
-        on=['state', 'district'],
-        how='inner'
+    merged = join_on_keys(
+        uesi_df[['state', 'district', KEY, 'UESI_Score']],
+        resilience_df[[KEY, 'shock_intensity', 'resilience_tier']]
     )
     
     uesi_median = merged['UESI_Score'].median()
@@ -193,16 +205,23 @@ def create_archetypes(uesi_df, resilience_df):
 
 # Main Analysis Logic
 if analyze_button:
-    if not all([enrolment_file, demographic_file, biometric_file]):
+    if not use_pipeline_cube and not all([enrolment_file, demographic_file, biometric_file]):
         st.error("⚠️ Please upload all three CSV files (Enrolment, Demographic, Biometric)")
     else:
         with st.spinner("🔄 Loading and validating data..."):
-            enrol_df, enrol_error = load_and_validate_csv(enrolment_file)
-            demo_df, demo_error = load_and_validate_csv(demographic_file)
-            bio_df, bio_error = load_and_validate_csv(biometric_file)
+            if use_pipeline_cube:
+                cube, load_error = load_pipeline_cube(store_root)
+            else:
+                enrol_df, enrol_error = load_and_validate_csv(enrolment_file, 'enrolment')
+                demo_df, demo_error = load_and_validate_csv(demographic_file, 'demographic_updates')
+                bio_df, bio_error = load_and_validate_csv(biometric_file, 'biometric_updates')
+                load_error = enrol_error or demo_error or bio_error
+                if not load_error:
+                    # Same daily aggregate cube the pipeline builds, from the uploads (district keys numbered for these files)
+                    cube = build_cube({'Enrolment': enrol_df, 'Demographic': demo_df, 'Biometric': bio_df})
             
-            if any([enrol_error, demo_error, bio_error]):
-                st.error(f"Error loading files: {enrol_error or demo_error or bio_error}")
+            if load_error:
+                st.error(f"Error loading files: {load_error}")
             else:
                 st.success("✅ Data loaded successfully!")
                 
@@ -211,10 +230,10 @@ if analyze_button:
                 
                 # Run analyses
                 with st.spinner("🧮 Running UESI analysis..."):
-                    uesi_results = calculate_uesi(enrol_df, demo_df)
+                    uesi_results = calculate_uesi(cube)
                 
                 with st.spinner("🧮 Running Resilience analysis..."):
-                    resilience_results = calculate_resilience(enrol_df, demo_df, bio_df)
+                    resilience_results = calculate_resilience(cube)
                 
                 with st.spinner("🧮 Creating District Archetypes..."):
                     archetype_results = create_archetypes(uesi_results, resilience_results)
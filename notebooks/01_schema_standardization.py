@@ -1,6 +1,12 @@
 import pandas as pd
 import glob
 import os
+import argparse
+from date_parsing import detect_date_format, parse_dates
+from parallel import run_tasks
+from storage import ChunkWriter, DEFAULT_FORMAT, FORMATS, table_path, write_table
+from manifest import describe_file, fingerprint, load_manifest, manifest_key, pipeline_lock, save_manifest
+from lineage import file_key, load_ledger, save_ledger
 
 DATA_DIR = r"d:/UIDAI data hackathon/Data"
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
@@ -49,68 +55,187 @@ SCHEMA_MAPPINGS = {
     }
 }
 
-def standardize_category(name, config):
-    print(f"\n--- Standardising {name} ---")
-    path = os.path.join(DATA_DIR, config["subfolder"])
-    files = glob.glob(os.path.join(path, "*.csv"))
-    
-    for filepath in files:
-        filename = os.path.basename(filepath)
-        try:
+# Map subfolder to cleaned folder name
+# Task.md says: cleaned_data/enrolment, cleaned_data/demographic_updates, cleaned_data/biometric_updates
+FOLDER_MAP = {
+    "api_data_aadhar_enrolment": "enrolment",
+    "api_data_aadhar_demographic": "demographic_updates",
+    "api_data_aadhar_biometric": "biometric_updates"
+}
+
+# Rows held in memory at once in streaming mode (--stream)
+CHUNK_SIZE = 200000
+
+def standardize_frame(df, config, date_format=None):
+    """Rename columns and convert dates to datetime64"""
+    # 1. Rename Columns
+    df.rename(columns=config["rename_map"], inplace=True)
+
+    # 2. Standardize Date
+    if 'date' in df.columns:
+        # Convert 'DD-MM-YYYY' or other formats to datetime64 (written out as 'YYYY-MM-DD')
+        # Invalid dates become NaT, verifying consistency
+        df['date'] = parse_dates(df['date'], date_format)
+    return df
+
+def infer_stream_dtypes(filepath, config, chunk_size):
+    """
+    First streaming pass: resolve the dtype a whole-file read would give each column.
+    Per-chunk inference can disagree (e.g. int in one chunk, float in the next),
+    which would change how values are written. Also detects the file's date
+    format once, from the first chunk that has dates.
+    """
+    seen = {}
+    date_format = None
+    date_cols = [c for c, target in config["rename_map"].items() if target == 'date'] + ['date']
+
+    for chunk in pd.read_csv(filepath, chunksize=chunk_size, low_memory=False):
+        for col, dtype in chunk.dtypes.items():
+            seen.setdefault(col, set()).add(dtype)
+        if date_format is None:
+            for col in date_cols:
+                if col in chunk.columns and chunk[col].notna().any():
+                    date_format = detect_date_format(chunk[col])
+                    break
+
+    dtypes = {}
+    for col, kinds in seen.items():
+        if len(kinds) == 1:
+            dtypes[col] = kinds.pop()
+        elif all(k.kind in 'iuf' for k in kinds):
+            dtypes[col] = 'float64'
+        else:
+            dtypes[col] = 'object'
+    return dtypes, date_format
+
+def standardize_file(filepath, config, stream=False, chunk_size=CHUNK_SIZE, fmt=DEFAULT_FORMAT,
+                     previous=None, force=False):
+    """
+    Standardise one raw file into cleaned_data/<folder>.
+    Returns its manifest entry (None on error). If the raw content hash matches
+    `previous`, the last run wrote the same format and that output still exists,
+    the file is skipped.
+    """
+    filename = os.path.basename(filepath)
+    try:
+        target_folder = FOLDER_MAP.get(config["subfolder"], "misc")
+        out_path = os.path.join(CLEANED_DIR, target_folder)
+        os.makedirs(out_path, exist_ok=True)
+        out_file = os.path.join(out_path, filename)
+
+        raw_hash = fingerprint(filepath, previous)
+        if (not force and previous and previous["hash"] == raw_hash
+                and previous.get("format") == fmt and os.path.exists(table_path(out_file, fmt))):
+            print(f"File: {filename}")
+            print(f"  [SKIP] Unchanged since last run ({previous['rows']} rows)")
+            return previous
+
+        if stream:
+            # Two passes over the file, neither holding more than chunk_size rows:
+            # the first pins dtypes/date format, the second converts and appends.
+            dtypes, date_format = infer_stream_dtypes(filepath, config, chunk_size)
+            original_cols = list(pd.read_csv(filepath, nrows=0).columns)
+            current_cols = None
+            date_sample = []
+            rows = 0
+
+            writer = ChunkWriter(out_file, fmt)
+            reader = pd.read_csv(filepath, chunksize=chunk_size, dtype=dtypes, low_memory=False)
+            for chunk in reader:
+                rows += len(chunk)
+                chunk = standardize_frame(chunk, config, date_format)
+                if current_cols is None:
+                    current_cols = list(chunk.columns)
+                if 'date' in chunk.columns and len(date_sample) < 3:
+                    date_sample += chunk['date'].dropna().head(3 - len(date_sample)).dt.strftime('%Y-%m-%d').tolist()
+                writer.write(chunk)
+
+            if current_cols is None:
+                # Header-only file: still write the renamed header
+                df = standardize_frame(pd.read_csv(filepath, nrows=0), config)
+                current_cols = list(df.columns)
+                writer.write(df)
+            out_file = writer.close()
+        else:
             df = pd.read_csv(filepath, low_memory=False)
             original_cols = list(df.columns)
-            
-            # 1. Rename Columns
-            df.rename(columns=config["rename_map"], inplace=True)
-            
-            # 2. Standardize Date
-            if 'date' in df.columns:
-                # Convert 'DD-MM-YYYY' or other formats to 'YYYY-MM-DD'
-                # errors='coerce' will make invalid dates NaT, verifying consistency
-                df['date'] = pd.to_datetime(df['date'], dayfirst=True, errors='coerce').dt.strftime('%Y-%m-%d')
-            
-            # Verify basic schema
+            rows = len(df)
+            df = standardize_frame(df, config)
             current_cols = list(df.columns)
-            missing = [c for c in config["target_cols"] if c not in current_cols]
-            
-            print(f"File: {filename}")
-            print(f"  Orig Cols: {original_cols}")
-            print(f"  New Cols : {current_cols}")
-            if missing:
-                print(f"  [!] MISSING TARGET COLS: {missing}")
-            else:
-                print(f"  [OK] Schema Verified")
-            
-            # Check Date Sample
-            if 'date' in df.columns:
-                print(f"  Date Sample: {df['date'].dropna().head(3).tolist()}")
-
-            # SAVE FILE
-            # out_subdir = os.path.join(CLEANED_DIR, config["subfolder_key"]) # ERROR HERE
-            # User wants: cleaned_data/enrolment, cleaned_data/demographic_updates etc matching task.md
-            # Task.md says: cleaned_data/enrolment, cleaned_data/demographic_updates, cleaned_data/biometric_updates
-            
-            # Map subfolder to cleaned folder name
-            folder_map = {
-                "api_data_aadhar_enrolment": "enrolment",
-                "api_data_aadhar_demographic": "demographic_updates",
-                "api_data_aadhar_biometric": "biometric_updates"
-            }
-            target_folder = folder_map.get(config["subfolder"], "misc")
-            
-            out_path = os.path.join(CLEANED_DIR, target_folder)
-            os.makedirs(out_path, exist_ok=True)
-            
-            out_file = os.path.join(out_path, filename)
-            df.to_csv(out_file, index=False)
-            print(f"  [SAVED] {out_file}")
-
-        except Exception as e:
-            print(f"  [ERROR] {e}")
+            date_sample = df['date'].dropna().head(3).dt.strftime('%Y-%m-%d').tolist() if 'date' in df.columns else []
+
+        # Verify basic schema
+        missing = [c for c in config["target_cols"] if c not in current_cols]
+
+        print(f"File: {filename}")
+        print(f"  Orig Cols: {original_cols}")
+        print(f"  New Cols : {current_cols}")
+        if missing:
+            print(f"  [!] MISSING TARGET COLS: {missing}")
+        else:
+            print(f"  [OK] Schema Verified")
+
+        # Check Date Sample
+        if 'date' in current_cols:
+            print(f"  Date Sample: {date_sample}")
+
+        # SAVE FILE
+        if not stream:
+            out_file = write_table(df, out_file, fmt)
+        print(f"  [SAVED] {out_file}")
+        entry = describe_file(filepath, rows, original_cols, raw_hash)
+        entry["format"] = fmt
+        return entry
+
+    except Exception as e:
+        print(f"  [ERROR] {filename}: {e}")
+        return None
+
+def list_category_files(config):
+    path = os.path.join(DATA_DIR, config["subfolder"])
+    return sorted(glob.glob(os.path.join(path, "*.csv")))
 
 def main():
-    for category, config in SCHEMA_MAPPINGS.items():
-        standardize_category(category, config)
+    parser = argparse.ArgumentParser(description="Standardise raw Aadhaar CSV schemas")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read/convert/write in bounded chunks instead of whole files")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"Rows per chunk in streaming mode (default {CHUNK_SIZE})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Process pool size for per-file standardisation (default 1)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                        help=f"Storage format for cleaned files (default {DEFAULT_FORMAT})")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-standardise every file, ignoring the manifest")
+    args = parser.parse_args()
+    with pipeline_lock(CLEANED_DIR, "01_schema_standardization"):
+        standardize_all(args)
+
+def standardize_all(args):
+    """Standardise every raw file whose manifest entry is out of date"""
+    manifest = load_manifest(CLEANED_DIR)
+    ledger = load_ledger(CLEANED_DIR)
+
+    # Files are independent, so every file of every category goes into one pool.
+    plan = [(category, list_category_files(config)) for category, config in SCHEMA_MAPPINGS.items()]
+    jobs = [(f, SCHEMA_MAPPINGS[category], args.stream, args.chunk_size, args.format,
+             manifest["raw"].get(manifest_key(f)), args.force)
+            for category, files in plan for f in files]
+    results = run_tasks(standardize_file, jobs, args.workers)
+
+    for category, files in plan:
+        print(f"\n--- Standardising {category} ---")
+        for f in files:
+            log, entry = next(results)
+            print(log, end="")
+            if entry:
+                manifest["raw"][manifest_key(f)] = entry
+                folder = FOLDER_MAP.get(SCHEMA_MAPPINGS[category]["subfolder"], "misc")
+                ledger["files"].setdefault(file_key(folder, f), {}).update(
+                    {"category": folder, "file": os.path.basename(f), "raw_rows": entry["rows"]})
+
+    save_manifest(manifest, CLEANED_DIR)
+    save_ledger(ledger, CLEANED_DIR)
 
 if __name__ == "__main__":
     main()
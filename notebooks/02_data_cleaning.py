@@ -1,81 +1,142 @@
 import pandas as pd
-import glob
 import os
 import numpy as np
+import argparse
+from parallel import run_tasks
+from schema_registry import CATEGORY_SCHEMAS
+from dedup import drop_duplicates
+from storage import list_tables, read_table, table_format, write_table
+from manifest import describe_file, fingerprint, load_manifest, manifest_key, pipeline_lock, save_manifest
+from lineage import file_key, load_ledger, save_ledger
 
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 
-CATEGORIES = {
-    "enrolment": ["age_0_5", "age_5_17", "age_18_plus"],
-    "demographic_updates": ["age_5_17", "age_18_plus"],
-    "biometric_updates": ["age_5_17", "age_18_plus"]
-}
+CATEGORIES = {folder: schema["metrics"] for folder, schema in CATEGORY_SCHEMAS.items()}
 
-def clean_file(filepath, numeric_cols):
+def clean_frame(df, numeric_cols, dedup=None, report=True):
+    """
+    Apply the cleaning steps to one file's rows, printing what each step dropped.
+    Returns the cleaned frame and the per-step row counts. A file read in chunks
+    passes one StreamingDeduplicator for all of them (duplicates across chunks are
+    dropped too) and report=False, printing the summed counts with report_drops().
+    """
+    initial_rows = len(df)
+    
+    # 1. Convert Numeric Columns
+    for col in numeric_cols:
+        # Coerce errors to NaN, then fill with 0 or drop? 
+        # "Do NOT impute" -> usually means don't guess values. 
+        # If a count is non-numeric, it's likely bad data.
+        # We will coerce to NaN and drop rows if ALL metrics are NaN, or assume 0?
+        # Safer to coerce to numeric.
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+        
+    # 2. Drop duplicates
+    df = drop_duplicates(df) if dedup is None else dedup.filter(df)
+    dedup_rows = len(df)
+
+    # 3. Drop missing geography
+    # Critical: State, District
+    # Pincode might be missing legitimately? Task says "Drop rows with missing critical geography (district/PIN)" -> Strict.
+    # (Not in place: a StreamingDeduplicator still refers to the rows it returned.)
+    crit_geo = ['state', 'district', 'pincode']
+    before_geo = len(df)
+    df = df.dropna(subset=crit_geo)
+    after_geo = len(df)
+        
+    # 4. Filter out rows where all numeric metrics are 0 or NaN?
+    # Sometimes a row exists but has 0 updates. That's valid info (0 updates).
+    # But if all are NaN, it's useless.
+    df = df.dropna(subset=numeric_cols, how='all')
+    
+    final_rows = len(df)
+    stats = {
+        "rows_in": initial_rows,
+        "duplicates": initial_rows - dedup_rows,
+        "missing_geography": before_geo - after_geo,
+        "all_nan_metrics": after_geo - final_rows,
+        "rows_out": final_rows
+    }
+    if report:
+        report_drops(stats)
+    return df, stats
+
+def report_drops(stats):
+    if stats["duplicates"] > 0:
+        print(f"  Dropped {stats['duplicates']} duplicate rows")
+    if stats["missing_geography"] > 0:
+        print(f"  Dropped {stats['missing_geography']} rows with missing geography")
+    print(f"  Final Rows: {stats['rows_out']} (Removed total {stats['rows_in'] - stats['rows_out']})")
+
+def clean_file(filepath, numeric_cols, previous=None, force=False):
+    """
+    Clean one standardised file in place and return (manifest entry, drop counts).
+    Files whose content still matches the hash recorded after their last clean are
+    skipped and return no counts; errors return (None, None).
+    """
     filename = os.path.basename(filepath)
     print(f"\nCleaning {filename}...")
     
     try:
-        df = pd.read_csv(filepath)
-        initial_rows = len(df)
-        
-        # 1. Convert Numeric Columns
-        for col in numeric_cols:
-            # Coerce errors to NaN, then fill with 0 or drop? 
-            # "Do NOT impute" -> usually means don't guess values. 
-            # If a count is non-numeric, it's likely bad data.
-            # We will coerce to NaN and drop rows if ALL metrics are NaN, or assume 0?
-            # Safer to coerce to numeric.
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-        # 2. Drop duplicates
-        df.drop_duplicates(inplace=True)
-        dedup_rows = len(df)
-        if initial_rows - dedup_rows > 0:
-            print(f"  Dropped {initial_rows - dedup_rows} duplicate rows")
-
-        # 3. Drop missing geography
-        # Critical: State, District
-        # Pincode might be missing legitimately? Task says "Drop rows with missing critical geography (district/PIN)" -> Strict.
-        crit_geo = ['state', 'district', 'pincode']
-        before_geo = len(df)
-        df.dropna(subset=crit_geo, inplace=True)
-        after_geo = len(df)
-        
-        if before_geo - after_geo > 0:
-            print(f"  Dropped {before_geo - after_geo} rows with missing geography")
-            
-        # 4. Filter out rows where all numeric metrics are 0 or NaN?
-        # Sometimes a row exists but has 0 updates. That's valid info (0 updates).
-        # But if all are NaN, it's useless.
-        df.dropna(subset=numeric_cols, how='all', inplace=True)
-        
-        final_rows = len(df)
-        print(f"  Final Rows: {final_rows} (Removed total {initial_rows - final_rows})")
+        if not force and previous and previous["hash"] == fingerprint(filepath, previous):
+            print(f"  [SKIP] Unchanged since last clean ({previous['rows']} rows)")
+            return previous, None
 
-        # Overwrite file
-        df.to_csv(filepath, index=False)
-        return True
+        df = read_table(filepath)
+        df, stats = clean_frame(df, numeric_cols)
+
+        # Overwrite file (in the format it was stored in)
+        write_table(df, filepath, table_format(filepath))
+        return describe_file(filepath, stats["rows_out"], df.columns), stats
 
     except Exception as e:
         print(f"  [ERROR] {e}")
-        return False
+        return None, None
 
 def main():
+    parser = argparse.ArgumentParser(description="Clean standardised Aadhaar CSVs in place")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Process pool size for per-file cleaning (default 1)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-clean every file, ignoring the manifest")
+    args = parser.parse_args()
+    with pipeline_lock(CLEANED_DIR, "02_data_cleaning"):
+        clean_all(args)
+
+def clean_all(args):
+    """Clean every standardised file whose manifest entry is out of date"""
+    manifest = load_manifest(CLEANED_DIR)
+    ledger = load_ledger(CLEANED_DIR)
+
     print("Starting Data Cleaning (Phase 1.3)...")
-    
+
+    plan = []
     for folder, metrics in CATEGORIES.items():
         path = os.path.join(CLEANED_DIR, folder)
-        if not os.path.exists(path):
+        files = list_tables(path) if os.path.exists(path) else None
+        plan.append((folder, metrics, files))
+
+    jobs = [(f, metrics, manifest["cleaned"].get(manifest_key(f)), args.force)
+            for _, metrics, files in plan if files for f in files]
+    results = run_tasks(clean_file, jobs, args.workers)
+
+    for folder, metrics, files in plan:
+        if files is None:
             print(f"Skipping {folder}, does not exist.")
             continue
-            
-        files = glob.glob(os.path.join(path, "*.csv"))
+
         print(f"\nProcessing {folder} ({len(files)} files)")
-        
         for f in files:
-            clean_file(f, metrics)
+            log, (entry, stats) = next(results)
+            print(log, end="")
+            if entry:
+                manifest["cleaned"][manifest_key(f)] = entry
+            if stats:
+                ledger["files"].setdefault(file_key(folder, f), {}).update(
+                    {"category": folder, **stats})
 
+    save_manifest(manifest, CLEANED_DIR)
+    save_ledger(ledger, CLEANED_DIR)
     print("\nData Cleaning Complete.")
 
 if __name__ == "__main__":
@@ -1,67 +1,383 @@
 import pandas as pd
-import glob
 import os
+import argparse
+import sys
+import subprocess
+import tempfile
+import numpy as np
+from parallel import run_tasks
+from schema_registry import CATEGORY_SCHEMAS, apply_schema
+from dedup import StreamingDeduplicator, key_index, row_keys
+from storage import ChunkWriter, DEFAULT_FORMAT, FORMATS, find_table, list_tables, read_table, write_table
+from external_sort import merge_runs, write_runs
+from master_store import (PartitionWriter, compact_partitions, dataset_dir, delta_filters, load_master,
+                          partition_key, partition_months, partition_stats, read_partition, remove_partitioned,
+                          segment_count, write_partitioned)
+from column_store import remove_store
+from cube import refresh_cube
+from manifest import describe_file, fingerprint, load_manifest, manifest_key, pipeline_lock, save_manifest
+from lineage import file_key, load_ledger, merge_lineage, save_ledger
 
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 
-CATEGORIES = {
-    "enrolment": "enrolment_master.csv",
-    "demographic_updates": "demographic_master.csv",
-    "biometric_updates": "biometric_master.csv"
-}
+CATEGORIES = {folder: schema["master"] for folder, schema in CATEGORY_SCHEMAS.items()}
 
-def merge_category(folder_name, output_filename):
+# Rows held in memory by the out-of-core merge (--external)
+BUFFER_ROWS = 1000000
+
+def build_master(dfs, folder_name):
+    """
+    Concatenate one category's cleaned frames, dedup across files and sort.
+    Returns (master_df, stats); stats["file_overlaps"] lines up with dfs.
+    """
+    # GLOBAL DEDUPLICATION
+    # This handles the user's concern about "data mixed in files" (overlap).
+    # Each file is filtered against the row hashes of the files before it, so only
+    # unique rows are ever concatenated.
+    dedup = StreamingDeduplicator()
+    unique_dfs = []
+    file_overlaps = []
+    for df in dfs:
+        dropped_before = dedup.dropped
+        unique_dfs.append(dedup.filter(df))
+        file_overlaps.append(dedup.dropped - dropped_before)
+    before_dedup = dedup.rows_in
+    print(f"  Combined Rows (Pre-Dedup): {before_dedup}")
+
+    # Concatenate all files
+    master_df = pd.concat(unique_dfs, ignore_index=True)
+    after_dedup = len(master_df)
+
+    # Files with different state/district sets concat to object columns; re-type the master
+    master_df = apply_schema(master_df, folder_name, report=True, label="master")
+
+    if before_dedup - after_dedup > 0:
+        print(f"  [OVERLAP DETECTED] Removed {before_dedup - after_dedup} rows that existed in multiple files.")
+    else:
+        print("  No overlap found between files.")
+
+    # Sort for cleanliness
+    sort_cols = [c for c in ['state', 'district', 'date'] if c in master_df.columns]
+    if sort_cols:
+        master_df.sort_values(by=sort_cols, inplace=True)
+
+    stats = {
+        "rows_in": before_dedup,
+        "cross_file_overlap": before_dedup - after_dedup,
+        "master_rows": after_dedup,
+        "file_overlaps": file_overlaps
+    }
+    return master_df, stats
+
+def build_master_external(files, folder_name, output_path, fmt=DEFAULT_FORMAT, buffer_rows=BUFFER_ROWS,
+                          partition=False):
+    """
+    Out-of-core build_master: sorted runs + k-way merge, streamed straight to the
+    master file (and the partitioned dataset if partition is set).
+    Returns (written path, columns, stats) with the same stats as build_master.
+    """
+    with tempfile.TemporaryDirectory(prefix=f"_runs_{folder_name}_", dir=CLEANED_DIR) as run_dir:
+        runs, file_rows, dtypes = write_runs(files, run_dir, buffer_rows, category=folder_name)
+        before_dedup = sum(file_rows)
+        print(f"  Combined Rows (Pre-Dedup): {before_dedup}")
+        print(f"  External merge: {len(runs)} sorted runs, buffer {buffer_rows} rows")
+
+        file_overlaps = np.zeros(len(files), dtype='int64')
+        after_dedup = 0
+        columns = None
+        writer = ChunkWriter(output_path, fmt)
+        partitions = PartitionWriter(CLEANED_DIR, folder_name) if partition else None
+        for batch, dropped in merge_runs(runs, buffer_rows):
+            file_overlaps += np.bincount(dropped, minlength=len(files))
+            batch = batch.astype({c: t for c, t in dtypes.items() if c in batch.columns})
+            columns = list(batch.columns)
+            after_dedup += len(batch)
+            writer.write(batch)
+            if partitions:
+                partitions.write(batch)
+        output_path = writer.close()
+        if partitions:
+            print(f"  Partitioned: {len(partitions.partitions)} partitions in {partitions.close()}")
+        else:
+            remove_partitioned(CLEANED_DIR, folder_name)
+
+    if before_dedup - after_dedup > 0:
+        print(f"  [OVERLAP DETECTED] Removed {before_dedup - after_dedup} rows that existed in multiple files.")
+    else:
+        print("  No overlap found between files.")
+
+    stats = {
+        "rows_in": before_dedup,
+        "cross_file_overlap": before_dedup - after_dedup,
+        "master_rows": after_dedup,
+        "file_overlaps": file_overlaps.tolist()
+    }
+    return output_path, columns, stats
+
+def category_lineage(folder_name, keys, stats):
+    """Ledger update for one merged category; keys are the ledger keys of the merged files"""
+    files = {key: {"category": folder_name, "cross_file_overlap": overlap}
+             for key, overlap in zip(keys, stats["file_overlaps"])}
+    totals = {k: stats[k] for k in ["rows_in", "cross_file_overlap", "master_rows"]}
+    totals["files"] = len(keys)
+    return {"files": files, "categories": {folder_name: totals}}
+
+def append_category(folder_name, files, inputs, previous, previous_lineage=None, fmt=DEFAULT_FORMAT):
+    """
+    Append-only update of a partitioned master. Rows of cleaned files that are new
+    since the last merge are deduplicated among themselves and against the existing
+    rows with their districts and dates in the (state, month) partitions they touch
+    (read with Parquet filters), then written as new sorted segments; nothing else
+    is read or rewritten. Returns (entry, ledger update), or None when a full build
+    is needed (no dataset yet, a merged file changed, the master format changed, or
+    there is nothing new to append although the master needs rebuilding).
+    """
+    partitions = partition_stats(CLEANED_DIR, folder_name)
+    old_inputs = (previous or {}).get("inputs")
+    if not partitions or old_inputs is None:
+        print("  [APPEND] No partitioned master yet, doing a full build")
+        return None
+    changed = [k for k, h in old_inputs.items() if inputs.get(k) != h]
+    if changed:
+        print(f"  [APPEND] {len(changed)} merged file(s) changed or removed, doing a full build")
+        return None
+    if previous.get("format", DEFAULT_FORMAT) != fmt:
+        print(f"  [APPEND] Master format changes to {fmt}, doing a full build")
+        return None
+
+    new_files = [f for f in files if manifest_key(f) not in old_inputs]
+    if not new_files:
+        # Inputs are unchanged, so the skip check failed on the master itself (e.g. edited by hand)
+        print("  [APPEND] No new files but the master is out of date, doing a full build")
+        return None
+    dedup = StreamingDeduplicator()
+    new_dfs = []
+    file_overlaps = []
+    for f in new_files:
+        dropped_before = dedup.dropped
+        new_dfs.append(dedup.filter(read_table(f)))
+        file_overlaps.append(dedup.dropped - dropped_before)
+    sources = np.repeat(np.arange(len(new_dfs)), [len(df) for df in new_dfs])
+    new = apply_schema(pd.concat(new_dfs, ignore_index=True), folder_name)
+    print(f"  [APPEND] {len(new_files)} new file(s), {dedup.rows_in} rows")
+
+    # Existing rows: in the partitions the delta falls into, only those on its districts and dates
+    root = dataset_dir(CLEANED_DIR, folder_name)
+    rels = []
+    existing = []
+    for (state, month), part in new.groupby([new['state'].astype(str), partition_months(new)], sort=False):
+        rel = partition_key(state, month)
+        rels.append(rel)
+        if rel in partitions:
+            existing.append(read_partition(root, partitions[rel], filters=delta_filters(part)))
+    if existing:
+        existing = pd.concat(existing, ignore_index=True)[list(new.columns)]
+        seen = key_index(row_keys(existing, bits=128))
+        dup_mask = key_index(row_keys(new, bits=128)).isin(seen)
+        for source, n in enumerate(np.bincount(sources[dup_mask], minlength=len(new_dfs))):
+            file_overlaps[source] += int(n)
+        new = new[~dup_mask]
+    print(f"  [APPEND] Read {len(existing)} existing rows from {len(rels)} touched partition(s)")
+
+    sort_cols = [c for c in ['state', 'district', 'date'] if c in new.columns]
+    new = new.sort_values(sort_cols)
+    writer = PartitionWriter(CLEANED_DIR, folder_name, append=True)
+    writer.write(new)
+    writer.close()
+    # The column store mirrors the flat master, which lags until compaction
+    remove_store(CLEANED_DIR, folder_name)
+
+    overlap = dedup.rows_in - len(new)
+    if overlap > 0:
+        print(f"  [OVERLAP DETECTED] Removed {overlap} rows that already existed.")
+    print(f"  Appended {len(new)} rows as a new segment ({segment_count(writer.partitions)} segments pending compaction)")
+
+    entry = dict(previous)
+    entry.update({"inputs": inputs, "rows": previous["rows"] + len(new),
+                  "pending_rows": previous.get("pending_rows", 0) + len(new)})
+
+    totals = dict(previous_lineage or {})
+    lineage = category_lineage(folder_name, [file_key(folder_name, f) for f in new_files],
+                               {"rows_in": 0, "cross_file_overlap": 0, "master_rows": 0,
+                                "file_overlaps": file_overlaps})
+    lineage["categories"][folder_name] = {
+        "files": totals.get("files", len(old_inputs)) + len(new_files),
+        "rows_in": totals.get("rows_in", previous["rows"]) + dedup.rows_in,
+        "cross_file_overlap": totals.get("cross_file_overlap", 0) + overlap,
+        "master_rows": entry["rows"]
+    }
+    return entry, lineage
+
+def compact_category(folder_name, output_filename, previous):
+    """
+    Merge appended segments back into one sorted file per partition and, if rows were
+    appended since, rewrite the flat master from the dataset. Returns the updated entry.
+    """
+    print(f"\n--- Compacting {folder_name} ---")
+    n = compact_partitions(CLEANED_DIR, folder_name)
+    print(f"  Compacted {n} partition(s)")
+    if not previous or not previous.get("pending_rows"):
+        return previous
+
+    path = os.path.join(CLEANED_DIR, output_filename)
+    master_df = load_master(path)
+    sort_cols = [c for c in ['state', 'district', 'date'] if c in master_df.columns]
+    master_df = master_df.sort_values(sort_cols)
+    output_path = write_table(master_df, path, previous.get("format", DEFAULT_FORMAT))
+    print(f"  Rewrote {output_path} ({len(master_df)} rows)")
+
+    entry = describe_file(output_path, len(master_df), master_df.columns)
+    entry.update({"inputs": previous["inputs"], "format": previous.get("format", DEFAULT_FORMAT)})
+    return entry
+
+def merge_category(folder_name, output_filename, fmt=DEFAULT_FORMAT, previous=None, cleaned_entries=None,
+                   force=False, buffer_rows=None, partition=False, append=False, previous_lineage=None):
+    """
+    Build one category master and return (manifest entry, ledger update);
+    (None, None) if nothing was merged. The merge is skipped when the cleaned
+    inputs hash the same as at the last merge and the master on disk is untouched.
+    With buffer_rows set the master is built out of core (build_master_external);
+    partition also writes it as a state/month partitioned dataset (master_store).
+    append adds only new files to the partitioned dataset (append_category).
+    """
     print(f"\n--- Merging {folder_name} ---")
     input_path = os.path.join(CLEANED_DIR, folder_name)
-    files = glob.glob(os.path.join(input_path, "*.csv"))
+    files = list_tables(input_path)
     
     if not files:
         print("  No files found!")
-        return
+        return None, None
+
+    cleaned_entries = cleaned_entries or {}
+    inputs = {manifest_key(f): fingerprint(f, cleaned_entries.get(manifest_key(f))) for f in files}
+    master_path = find_table(os.path.join(CLEANED_DIR, output_filename))
+    if (not force and previous and master_path
+            and previous.get("inputs") == inputs and previous.get("format") == fmt
+            and fingerprint(master_path, previous) == previous["hash"]
+            and not (partition and partition_stats(CLEANED_DIR, folder_name) is None)
+            and (append or not previous.get("pending_rows"))):
+        print(f"  [SKIP] Inputs unchanged since last merge ({previous['rows']} rows in {master_path})")
+        return previous, None
+
+    if append and not force:
+        result = append_category(folder_name, files, inputs, previous, previous_lineage, fmt)
+        if result is not None:
+            return result
+        partition = True
+
+    if buffer_rows:
+        output_path, columns, stats = build_master_external(
+            files, folder_name, os.path.join(CLEANED_DIR, output_filename), fmt, buffer_rows, partition)
+        print(f"  Saved master to: {output_path}")
+        print(f"  Final Master Rows: {stats['master_rows']}")
+
+        entry = describe_file(output_path, stats["master_rows"], columns)
+        entry.update({"inputs": inputs, "format": fmt})
+        keys = [file_key(folder_name, f) for f in files]
+        return entry, category_lineage(folder_name, keys, stats)
 
     dfs = []
+    keys = []
     total_raw_rows = 0
     
     for f in files:
         try:
-            df = pd.read_csv(f)
+            df = read_table(f)
             dfs.append(df)
+            keys.append(file_key(folder_name, f))
             total_raw_rows += len(df)
         except Exception as e:
             print(f"  Error reading {os.path.basename(f)}: {e}")
             
     if not dfs:
-        return
-
-    # Concatenate all files
-    master_df = pd.concat(dfs, ignore_index=True)
-    print(f"  Combined Rows (Pre-Dedup): {len(master_df)}")
-
-    # GLOBAL DEDUPLICATION
-    # This handles the user's concern about "data mixed in files" (overlap)
-    before_dedup = len(master_df)
-    master_df.drop_duplicates(inplace=True)
-    after_dedup = len(master_df)
-    
-    if before_dedup - after_dedup > 0:
-        print(f"  [OVERLAP DETECTED] Removed {before_dedup - after_dedup} rows that existed in multiple files.")
-    else:
-        print("  No overlap found between files.")
+        return None, None
 
-    # Sort for cleanliness
-    sort_cols = [c for c in ['state', 'district', 'date'] if c in master_df.columns]
-    if sort_cols:
-        master_df.sort_values(by=sort_cols, inplace=True)
+    master_df, stats = build_master(dfs, folder_name)
 
     # Save Master
-    output_path = os.path.join(CLEANED_DIR, output_filename)
-    master_df.to_csv(output_path, index=False)
+    output_path = write_table(master_df, os.path.join(CLEANED_DIR, output_filename), fmt)
     print(f"  Saved master to: {output_path}")
     print(f"  Final Master Rows: {len(master_df)}")
+    if partition:
+        root, n = write_partitioned(master_df, CLEANED_DIR, folder_name)
+        print(f"  Partitioned: {n} partitions in {root}")
+    else:
+        remove_partitioned(CLEANED_DIR, folder_name)
+
+    entry = describe_file(output_path, len(master_df), master_df.columns)
+    entry.update({"inputs": inputs, "format": fmt})
+    return entry, category_lineage(folder_name, keys, stats)
 
 def main():
+    parser = argparse.ArgumentParser(description="Merge cleaned files into category masters")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Merge up to this many categories at the same time (default 1)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                        help=f"Storage format for the master files (default {DEFAULT_FORMAT})")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every master, ignoring the manifest")
+    parser.add_argument("--external", action="store_true",
+                        help="Out-of-core merge (sorted runs + k-way merge) for masters larger than RAM")
+    parser.add_argument("--buffer-rows", type=int, default=BUFFER_ROWS,
+                        help=f"Rows held in memory per merge with --external (default {BUFFER_ROWS})")
+    parser.add_argument("--partition", action="store_true",
+                        help="Also write each master as a state/month partitioned Parquet dataset")
+    parser.add_argument("--append", action="store_true",
+                        help="Add only new cleaned files to the partitioned masters as sorted segments")
+    parser.add_argument("--compact", action="store_true",
+                        help="Merge appended segments and rewrite the flat masters, then exit")
+    parser.add_argument("--no-background-compact", action="store_true",
+                        help="With --append, don't start a background compaction afterwards")
+    args = parser.parse_args()
+
+    if args.compact:
+        with pipeline_lock(CLEANED_DIR, "03_data_merging --compact"):
+            compact_all()
+        return
+
+    with pipeline_lock(CLEANED_DIR, "03_data_merging"):
+        merge_all(args)
+
+    if args.append and not args.no_background_compact:
+        # Segments are folded back in by a detached process, so the daily append returns right away.
+        # It takes the pipeline lock once this run has released it; stages started meanwhile stop.
+        log_path = os.path.join(CLEANED_DIR, "compaction.log")
+        with open(log_path, "a") as log:
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--compact"],
+                             stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        print(f"\nBackground compaction started (log: {log_path})")
+
+def compact_all():
+    """Compact every category's segments and record the rewritten masters"""
+    manifest = load_manifest(CLEANED_DIR)
     for folder, outfile in CATEGORIES.items():
-        merge_category(folder, outfile)
+        entry = compact_category(folder, outfile, manifest["masters"].get(folder))
+        if entry:
+            manifest["masters"][folder] = entry
+    save_manifest(manifest, CLEANED_DIR)
+    refresh_cube(CLEANED_DIR)
+
+def merge_all(args):
+    """Merge (or append to) every category master and refresh the cube"""
+    manifest = load_manifest(CLEANED_DIR)
+    ledger = load_ledger(CLEANED_DIR)
+
+    # Each merge holds a whole master in memory, so the pool never exceeds the category count
+    workers = min(args.workers, len(CATEGORIES))
+    buffer_rows = args.buffer_rows if args.external else None
+    jobs = [(folder, outfile, args.format, manifest["masters"].get(folder), manifest["cleaned"], args.force,
+             buffer_rows, args.partition, args.append, ledger["categories"].get(folder))
+            for folder, outfile in CATEGORIES.items()]
+    for folder, (log, (entry, lineage)) in zip(CATEGORIES, run_tasks(merge_category, jobs, workers)):
+        print(log, end="")
+        if entry:
+            manifest["masters"][folder] = entry
+        merge_lineage(ledger, lineage)
+
+    save_manifest(manifest, CLEANED_DIR)
+    save_ledger(ledger, CLEANED_DIR)
+    # The analysis stages read the daily cube, not the masters
+    refresh_cube(CLEANED_DIR)
 
 if __name__ == "__main__":
     main()
@@ -2,6 +2,9 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+from cube import MEASURE, load_cube
+from figures import FigureRenderer
+from schema_registry import ALL_METRICS
 
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 FIG_DIR = r"d:/UIDAI data hackathon/outputs/figures"
@@ -10,47 +13,58 @@ OS_REPORT = r"d:/UIDAI data hackathon/eda_summary.md"
 os.makedirs(FIG_DIR, exist_ok=True)
 os.makedirs(os.path.dirname(OS_REPORT), exist_ok=True)
 
-MASTERS = {
-    "Enrolment": "enrolment_master.csv",
-    "Demographic": "demographic_master.csv",
-    "Biometric": "biometric_master.csv"
-}
-
-def load_data():
-    data = {}
-    for name, f in MASTERS.items():
-        path = os.path.join(CLEANED_DIR, f)
-        if os.path.exists(path):
-            print(f"Loading {name}...")
-            df = pd.read_csv(path)
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-            data[name] = df
-    return data
-
-def plot_temporal_trends(data, f):
-    f.write("## 1. Temporal Trends\n\n")
+MASTERS = ["Enrolment", "Demographic", "Biometric"]
+TOP_K = 5
+
+class EDAResults:
+    """
+    Every aggregate the report uses, filled in one pass per category: each
+    category's rows are grouped once to (district, date, age_bucket) and the
+    monthly series, age sums and district ranking are rolled up from that.
+    """
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.monthly = {}
+        self.age_sums = {}
+        self.district_totals = {}
+
+    def add(self, name, rows):
+        # Missing districts/dates stay in the base so the age sums cover every row
+        base = rows.groupby(['district', 'date', 'age_bucket'], observed=True, dropna=False)[MEASURE].sum()
+        daily = base.groupby(level='date').sum()
+        if len(daily):
+            # Resample monthly for smoother plot
+            self.monthly[name] = daily.resample('ME').sum()
+        self.age_sums[name] = base.groupby(level='age_bucket', observed=True).sum()
+        self.district_totals[name] = base.groupby(level='district', observed=True).sum().sort_values(ascending=False)
+
+    def age_table(self):
+        """Age buckets x categories (NaN where a category doesn't record a bucket)"""
+        table = pd.DataFrame(self.age_sums).astype('float64')
+        table = table.reindex([c for c in ALL_METRICS if c in table.index])
+        table.index.name = None
+        return table
+
+    def top(self, name):
+        return self.district_totals[name].head(self.top_k)
+
+    def bottom(self, name):
+        totals = self.district_totals[name]
+        return totals[totals > 0].tail(self.top_k) # Ignore actual 0s for bottom k
+
+def summarize(cube, names=MASTERS, top_k=TOP_K):
+    results = EDAResults(top_k)
+    groups = dict(list(cube.groupby('category', observed=True)))
+    for name in names:
+        if name in groups:
+            results.add(name, groups[name])
+    return results
+
+def render_temporal_trends(monthly, out_path):
     plt.figure(figsize=(14, 6))
-    
-    for name, df in data.items():
-        if 'date' not in df.columns: continue
-        
-        # Determine numeric metric columns
-        if name == "Enrolment":
-            cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-        elif name == "Demographic":
-            cols = ['age_5_17', 'age_18_plus']
-        elif name == "Biometric":
-            cols = ['age_5_17', 'age_18_plus']
-            
-        # Sum daily
-        daily = df.groupby('date')[cols].sum().sum(axis=1)
-        # Resample monthly for smoother plot
-        monthly = daily.resample('ME').sum()
-        
-        plt.plot(monthly.index, monthly.values, label=name, marker='o')
-        
-        f.write(f"- **{name} Peak**: {monthly.max():,.0f} in {monthly.idxmax().strftime('%b %Y')}\n")
+    for name, series in monthly.items():
+        plt.plot(series.index, series.values, label=name, marker='o')
 
     plt.title('Monthly Activity Trends (Enrolment vs Updates)')
     plt.xlabel('Date')
@@ -58,31 +72,19 @@ def plot_temporal_trends(data, f):
     plt.legend()
     plt.grid(True)
     plt.tight_layout()
+    plt.savefig(out_path)
+
+def plot_temporal_trends(results, f, figures):
+    f.write("## 1. Temporal Trends\n\n")
     
+    for name, monthly in results.monthly.items():
+        f.write(f"- **{name} Peak**: {monthly.max():,.0f} in {monthly.idxmax().strftime('%b %Y')}\n")
+
     out_path = os.path.join(FIG_DIR, "temporal_trends.png")
-    plt.savefig(out_path)
-    plt.close()
+    figures.submit(render_temporal_trends, results.monthly, out_path)
     f.write(f"\n![Temporal Trends]({out_path})\n\n")
-    print("Saved temporal_trends.png")
 
-def plot_age_distribution(data, f):
-    f.write("## 2. Age Distribution\n\n")
-    
-    summary = []
-    
-    for name, df in data.items():
-        if name == "Enrolment":
-            cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-        else:
-            cols = ['age_5_17', 'age_18_plus']
-            
-        totals = df[cols].sum()
-        totals.name = name
-        summary.append(totals)
-        
-    df_chem = pd.DataFrame(summary).T
-    
-    # Plot
+def render_age_distribution(df_chem, out_path):
     df_chem.plot(kind='bar', figsize=(10, 6))
     plt.title('Age-wise Distribution by Category')
     plt.ylabel('Total Volume')
@@ -90,54 +92,46 @@ def plot_age_distribution(data, f):
     plt.xticks(rotation=0)
     plt.grid(axis='y')
     plt.tight_layout()
+    plt.savefig(out_path)
+
+def plot_age_distribution(results, f, figures):
+    f.write("## 2. Age Distribution\n\n")
+    
+    df_chem = results.age_table()
     
     out_path = os.path.join(FIG_DIR, "age_distribution.png")
-    plt.savefig(out_path)
-    plt.close()
+    figures.submit(render_age_distribution, df_chem, out_path)
     
     f.write(f"\n![Age Distribution]({out_path})\n\n")
     f.write("### Raw Age Counts\n")
     f.write("```\n")
     f.write(df_chem.to_string() + "\n")
     f.write("```\n\n")
-    print("Saved age_distribution.png")
 
-def analyze_geography(data, f):
+def analyze_geography(results, f):
     f.write("## 3. Geographic Analysis\n\n")
     
-    for name, df in data.items():
-        if 'district' not in df.columns: continue
-        
-        if name == "Enrolment":
-            cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-        else:
-            cols = ['age_5_17', 'age_18_plus']
-            
-        df['total'] = df[cols].sum(axis=1)
-        dist_stats = df.groupby('district')['total'].sum().sort_values(ascending=False)
-        
-        top_5 = dist_stats.head(5)
-        bottom_5 = dist_stats[dist_stats > 0].tail(5) # Ignore actual 0s for bottom 5
-        
-        f.write(f"### {name} - Top 5 Districts\n")
-        for d, v in top_5.items():
+    for name in results.district_totals:
+        f.write(f"### {name} - Top {results.top_k} Districts\n")
+        for d, v in results.top(name).items():
             f.write(f"- {d}: {v:,.0f}\n")
             
-        f.write(f"\n### {name} - Bottom 5 Districts (Non-Zero)\n")
-        for d, v in bottom_5.items():
+        f.write(f"\n### {name} - Bottom {results.top_k} Districts (Non-Zero)\n")
+        for d, v in results.bottom(name).items():
             f.write(f"- {d}: {v:,.0f}\n")
         f.write("\n")
 
 def main():
     print("Starting EDA...")
-    data = load_data()
+    cube = load_cube(MASTERS, cleaned_dir=CLEANED_DIR)
+    results = summarize(cube)
     
-    with open(OS_REPORT, "w") as f:
+    with open(OS_REPORT, "w") as f, FigureRenderer() as figures:
         f.write("# Exploratory Data Analysis Report\n\n")
         
-        plot_temporal_trends(data, f)
-        plot_age_distribution(data, f)
-        analyze_geography(data, f)
+        plot_temporal_trends(results, f, figures)
+        plot_age_distribution(results, f, figures)
+        analyze_geography(results, f)
         
     print(f"EDA Complete. Report saved to {OS_REPORT}")
 
@@ -1,7 +1,11 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import numpy as np
 import os
+from cube import district_totals, load_cube
+from districts import KEY, attach_names, dimension_from, key_array
+from figures import FigureRenderer
 
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 FIG_DIR = r"d:/UIDAI data hackathon/outputs/figures"
@@ -9,39 +13,27 @@ OS_REPORT = r"d:/UIDAI data hackathon/geographic_eda.md"
 
 os.makedirs(FIG_DIR, exist_ok=True)
 
-MASTERS = {
-    "Enrolment": "enrolment_master.csv",
-    "Demographic": "demographic_master.csv",
-    "Biometric": "biometric_master.csv"
-}
+MASTERS = ["Enrolment", "Demographic", "Biometric"]
 
 def load_district_totals():
-    combined = None
+    cube = load_cube(MASTERS, cleaned_dir=CLEANED_DIR)
+    size = int(cube[KEY].max()) + 1 if len(cube) else 0
     
-    for name, f in MASTERS.items():
-        path = os.path.join(CLEANED_DIR, f)
-        if not os.path.exists(path): continue
-        
-        df = pd.read_csv(path)
-        
-        # Determine total column
-        if name == "Enrolment":
-            cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-        else:
-            cols = ['age_5_17', 'age_18_plus']
-            
-        df['total'] = df[cols].sum(axis=1)
-        
-        # Group by district
-        dist_total = df.groupby('district')['total'].sum().reset_index()
-        dist_total.rename(columns={'total': f'{name}_Volume'}, inplace=True)
-        
-        if combined is None:
-            combined = dist_total
-        else:
-            combined = pd.merge(combined, dist_total, on='district', how='outer').fillna(0)
-            
-    return combined
+    # One array per category, indexed by district key; a district missing from a category counts 0
+    present = np.zeros(size, dtype=bool)
+    volumes = {}
+    for name in MASTERS:
+        # Volume = every age bucket the category records, summed per district
+        dist_total = district_totals(cube, [name])
+        if len(dist_total) == 0: continue
+        present[dist_total.index.to_numpy()] = True
+        volumes[f'{name}_Volume'] = key_array(dist_total, size)
+    
+    if not volumes:
+        return None
+    keys = np.flatnonzero(present)
+    combined = pd.DataFrame({KEY: keys, **{col: arr[keys] for col, arr in volumes.items()}})
+    return attach_names(combined, dimension_from(cube))
 
 def analyze_geo_patterns(df, f):
     f.write("## Geographic Update Intensity\n\n")
@@ -69,9 +61,7 @@ def analyze_geo_patterns(df, f):
     
     return significant
 
-def plot_geo_scatter(df, f):
-    f.write("## Enrolment vs Update Volume\n\n")
-    
+def render_geo_scatter(df, out_path):
     plt.figure(figsize=(10, 6))
     sns.scatterplot(data=df, x='Enrolment_Volume', y='Total_Updates', alpha=0.6)
     
@@ -86,21 +76,24 @@ def plot_geo_scatter(df, f):
         plt.text(row['Enrolment_Volume'], row['Total_Updates'], row['district'], 
                  fontsize=9, ha='right', color='black', weight='bold')
 
-    out_path = os.path.join(FIG_DIR, "geo_scatter.png")
     plt.savefig(out_path)
-    plt.close()
+
+def plot_geo_scatter(df, f, figures):
+    f.write("## Enrolment vs Update Volume\n\n")
+    
+    out_path = os.path.join(FIG_DIR, "geo_scatter.png")
+    figures.submit(render_geo_scatter, df[['district', 'Enrolment_Volume', 'Total_Updates']], out_path)
     
     f.write(f"![Enrolment vs Updates]({out_path})\n\n")
-    print("Saved geo_scatter.png")
 
 def main():
     print("Starting Geographic EDA...")
     df = load_district_totals()
     
-    with open(OS_REPORT, "w") as f:
+    with open(OS_REPORT, "w") as f, FigureRenderer() as figures:
         f.write("# Geographic EDA Report\n\n")
         significant_df = analyze_geo_patterns(df, f)
-        plot_geo_scatter(significant_df, f)
+        plot_geo_scatter(significant_df, f, figures)
         
     print(f"Geographic EDA Complete. Saved to {OS_REPORT}")
 
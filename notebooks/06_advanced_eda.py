@@ -1,48 +1,47 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import numpy as np
 import os
+from numpy.lib.stride_tricks import sliding_window_view
 from statsmodels.tsa.seasonal import seasonal_decompose
+from cube import load_cube, daily_totals, rollup
+from districts import KEY, attach_names, dimension_from
+from figures import FigureRenderer
 
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+OUTPUT_DIR = r"d:/UIDAI data hackathon/outputs"
 FIG_DIR = r"d:/UIDAI data hackathon/outputs/figures"
 OS_REPORT = r"d:/UIDAI data hackathon/advanced_eda_report.md"
 
 os.makedirs(FIG_DIR, exist_ok=True)
 
-MASTERS = {
-    "Enrolment": "enrolment_master.csv",
-    "Demographic": "demographic_master.csv",
-    "Biometric": "biometric_master.csv"
-}
-
-def load_data():
-    data = {}
-    for name, f in MASTERS.items():
-        path = os.path.join(CLEANED_DIR, f)
-        if os.path.exists(path):
-            print(f"Loading {name}...")
-            df = pd.read_csv(path)
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-            data[name] = df
-    return data
-
-def plot_churn_heatmap(data, f):
+MASTERS = ["Enrolment", "Demographic", "Biometric"]
+
+# Per-district decomposition runs on daily volume with a weekly cycle: the masters
+# span months rather than years, too short for a 12-month period per district.
+DISTRICT_PERIOD = 7
+TOP_SEASONAL = 10
+
+def render_churn_heatmap(combined_pct, out_path):
+    plt.figure(figsize=(10, 12))
+    sns.heatmap(combined_pct, annot=True, cmap="YlOrRd", fmt=".1f")
+    plt.title('State-wise Update Intensity: Who are they updating?')
+    plt.xlabel('Age Group')
+    plt.ylabel('State')
+    plt.tight_layout()
+    plt.savefig(out_path)
+
+def plot_churn_heatmap(cube, f, figures):
     f.write("## 1. State-Age Churn Heatmap\n\n")
     
     # Combine all data to get total activity by State & Age
     # We focus on Updates (Demographic + Biometric) as "Churn"
     
-    demo = data['Demographic'][['state', 'age_5_17', 'age_18_plus']].copy()
-    bio = data['Biometric'][['state', 'age_5_17', 'age_18_plus']].copy()
-    
-    # Sum by state
-    demo_grp = demo.groupby('state').sum()
-    bio_grp = bio.groupby('state').sum()
-    
-    # Combine
-    combined = demo_grp.add(bio_grp, fill_value=0)
+    # Sum by state and age bucket
+    # Plain floats for seaborn
+    combined = rollup(cube, ['state'], ['Demographic', 'Biometric'], ['age_5_17', 'age_18_plus'],
+                      columns='age_bucket')[['age_5_17', 'age_18_plus']].fillna(0).astype('float64')
     # Rename for clarity
     combined.columns = ['Child_Updates (5-17)', 'Adult_Updates (18+)']
     
@@ -54,35 +53,30 @@ def plot_churn_heatmap(data, f):
     # Let's keep all but sort by Adult %
     combined_pct = combined_pct.sort_values('Adult_Updates (18+)', ascending=False)
     
-    plt.figure(figsize=(10, 12))
-    sns.heatmap(combined_pct, annot=True, cmap="YlOrRd", fmt=".1f")
-    plt.title('State-wise Update Intensity: Who are they updating?')
-    plt.xlabel('Age Group')
-    plt.ylabel('State')
-    plt.tight_layout()
-    
     out_path = os.path.join(FIG_DIR, "churn_heatmap.png")
-    plt.savefig(out_path)
-    plt.close()
+    figures.submit(render_churn_heatmap, combined_pct, out_path)
     
     f.write(f"![Churn Heatmap]({out_path})\n\n")
     f.write("> **Insight**: States with high 'Child' intensity are managing school-age compliance. States with high 'Adult' intensity are dealing with migration/correction.\n\n")
-    print("Saved churn_heatmap.png")
 
-def analyze_seasonality(data, f):
+def render_decomposition(decomposition, out_path):
+    # decomposition.plot() creates its own figure
+    fig = decomposition.plot()
+    fig.set_size_inches(12, 10)
+    fig.savefig(out_path)
+
+def analyze_seasonality(cube, f, figures):
     f.write("## 2. Seasonality Decomposition (Biometric Updates)\n\n")
     
-    df = data['Biometric']
-    if 'date' not in df.columns: return
-
     # Daily sum
-    daily = df.groupby('date')[['age_5_17', 'age_18_plus']].sum().sum(axis=1)
+    daily = daily_totals(cube, ['Biometric'], ['age_5_17', 'age_18_plus'])
+    if len(daily) == 0: return
     
     # Resample to Monthly
     monthly = daily.resample('ME').sum()
     
     # Fill missing values if any
-    monthly = monthly.fillna(method='ffill')
+    monthly = monthly.ffill()
 
     # Decompose (Period = 12 months)
     # We need at least 2 cycles (24 months) for robust seasonality, 
@@ -94,43 +88,147 @@ def analyze_seasonality(data, f):
     try:
         decomposition = seasonal_decompose(monthly, model='additive', period=12)
         
-        plt.figure(figsize=(12, 10))
-        decomposition.plot()
-        plt.suptitle('Seasonality Decomposition: Biometric Updates', fontsize=16)
-        plt.tight_layout()
-        
         out_path = os.path.join(FIG_DIR, "seasonality_decomposition.png")
-        plt.savefig(out_path) # statsmodels plot() returns figure, but sometimes need to save current fig
-        plt.close() 
-
-        # Hack because decomposition.plot() creates its own figure
-        # We need to save the *current* figure after calling plot()
-        # Actually statsmodels.plot() displays it. 
-        # Safer way:
-        fig = decomposition.plot()
-        fig.set_size_inches(12, 10)
-        fig.savefig(out_path)
-        fig.clf()
+        figures.submit(render_decomposition, decomposition, out_path)
         
         f.write(f"![Seasonality]({out_path})\n\n")
         f.write("> **Trend**: Shows the underlying growth/decline.\n")
         f.write("> **Seasonal**: Shows the repeating 'July Pattern'.\n")
         f.write("> **Residual**: Random noise.\n\n")
-        print("Saved seasonality_decomposition.png")
         
     except Exception as e:
         f.write(f"Could not perform decomposition: {e}\n")
         print(f"Decomposition Error: {e}")
 
+def district_panel(cube, category):
+    """
+    District x day matrix of a category's volume: (district keys, dates, matrix).
+    Days a district has no rows count as 0.
+    """
+    daily = rollup(cube, [KEY, 'date'], [category])
+    dates = daily.index.get_level_values('date')
+    days = pd.date_range(dates.min(), dates.max(), freq='D')
+    keys, row = np.unique(daily.index.get_level_values(KEY).to_numpy(), return_inverse=True)
+    col = ((dates - days[0]) // pd.Timedelta(days=1)).to_numpy()
+    panel = np.zeros((len(keys), len(days)))
+    panel[row, col] = daily.to_numpy(dtype='float64')
+    return keys, days, panel
+
+def batch_decompose(panel, period):
+    """
+    Additive decomposition of every row of a (series x time) matrix at once, as
+    statsmodels seasonal_decompose does for a single series: centred moving-average
+    trend, seasonal index = mean detrended value per phase (centred on 0), residual
+    = the rest. Trend and residual are NaN for the first and last period // 2 points.
+    """
+    n_series, n = panel.shape
+    if n < 2 * period:
+        raise ValueError(f"{n} observations, need at least {2 * period} (two full cycles)")
+    if period % 2 == 0:
+        weights = np.r_[0.5, np.ones(period - 1), 0.5] / period
+    else:
+        weights = np.ones(period) / period
+    half = len(weights) // 2
+
+    trend = np.full(panel.shape, np.nan)
+    trend[:, half:n - half] = sliding_window_view(panel, len(weights), axis=1) @ weights
+    detrended = panel - trend
+
+    # Seasonal index: average each phase over the cycles (padded to whole cycles with NaN)
+    cycles = -(-n // period)
+    padded = np.full((n_series, cycles * period), np.nan)
+    padded[:, :n] = detrended
+    index = np.nanmean(padded.reshape(n_series, cycles, period), axis=1)
+    index -= index.mean(axis=1, keepdims=True)
+
+    seasonal = index[:, np.arange(n) % period]
+    resid = panel - trend - seasonal
+    return trend, seasonal, resid, index
+
+def seasonal_strength(seasonal, resid):
+    """max(0, 1 - Var(resid) / Var(seasonal + resid)) per row, over the points with a trend"""
+    total = np.nanvar(seasonal + resid, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        strength = np.where(total > 0, 1 - np.nanvar(resid, axis=1) / total, 0.0)
+    return np.clip(strength, 0, None)
+
+def decompose_districts(cube, categories=MASTERS, period=DISTRICT_PERIOD):
+    """
+    Batched decomposition of every district's daily series for each category.
+    Returns the per-district component table (long: one row per district, category
+    and day) and the seasonal strength table, both keyed by district.
+    """
+    components, strengths = [], []
+    for category in categories:
+        if not (cube['category'] == category).any():
+            continue
+        keys, days, panel = district_panel(cube, category)
+        trend, seasonal, resid, index = batch_decompose(panel, period)
+
+        n_series, n = panel.shape
+        components.append(pd.DataFrame({
+            KEY: np.repeat(keys, n),
+            'category': category,
+            'date': np.tile(days, n_series),
+            'observed': panel.ravel(),
+            'trend': trend.ravel(),
+            'seasonal': seasonal.ravel(),
+            'resid': resid.ravel()
+        }))
+        strengths.append(pd.DataFrame({
+            KEY: keys,
+            'category': category,
+            'seasonal_strength': seasonal_strength(seasonal, resid),
+            'seasonal_amplitude': index.max(axis=1) - index.min(axis=1),
+            'peak_day': days[:period].day_name().to_numpy()[index.argmax(axis=1)]
+        }))
+
+    if not components:
+        return None, None
+    components = pd.concat(components, ignore_index=True)
+    strengths = pd.concat(strengths, ignore_index=True).sort_values('seasonal_strength', ascending=False, kind='stable')
+    return components, strengths.reset_index(drop=True)
+
+def analyze_district_seasonality(cube, f):
+    f.write("## 3. District Seasonality (Weekly Cycle)\n\n")
+    
+    try:
+        components, strengths = decompose_districts(cube)
+    except ValueError as e:
+        f.write(f"Could not perform district decomposition: {e}\n\n")
+        print(f"District Decomposition Error: {e}")
+        return
+    if components is None: return
+    
+    dim = dimension_from(cube)
+    components_path = os.path.join(OUTPUT_DIR, "district_seasonality.csv")
+    attach_names(components, dim).to_csv(components_path, index=False)
+    strength_path = os.path.join(OUTPUT_DIR, "district_seasonal_strength.csv")
+    strengths = attach_names(strengths, dim)
+    strengths.to_csv(strength_path, index=False)
+    print(f"Saved district decomposition to {components_path} and ranking to {strength_path}")
+    
+    f.write(f"Trend, seasonal and residual components for {strengths[['state', 'district']].drop_duplicates().shape[0]} districts "
+            f"(period {DISTRICT_PERIOD} days): `{components_path}`\n\n")
+    f.write(f"### Top {TOP_SEASONAL} Districts by Seasonal Strength\n")
+    f.write("| District | State | Category | Strength | Weekly Swing | Peak Day |\n")
+    f.write("| :--- | :--- | :--- | :--- | :--- | :--- |\n")
+    for _, row in strengths.head(TOP_SEASONAL).iterrows():
+        f.write(f"| {row['district']} | {row['state']} | {row['category']} | {row['seasonal_strength']:.2f} | "
+                f"{row['seasonal_amplitude']:,.0f} | {row['peak_day']} |\n")
+    f.write(f"\n> **Seasonal strength** = 1 - Var(residual) / Var(seasonal + residual): near 1, the weekly pattern explains most of the day-to-day movement. Full ranking: `{strength_path}`\n\n")
+
 def main():
     print("Starting Advanced EDA...")
-    data = load_data()
+    cube = load_cube(MASTERS, cleaned_dir=CLEANED_DIR)
     
-    with open(OS_REPORT, "w") as f:
+    with open(OS_REPORT, "w") as f, FigureRenderer() as figures:
         f.write("# Advanced EDA Report\n\n")
         try:
-            plot_churn_heatmap(data, f)
-            analyze_seasonality(data, f)
+            plot_churn_heatmap(cube, f, figures)
+            analyze_seasonality(cube, f, figures)
+            analyze_district_seasonality(cube, f)
+            figures.wait()
         except Exception as e:
             print(f"Analysis Error: {e}")
             f.write(f"\nError: {e}")
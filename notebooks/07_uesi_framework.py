@@ -1,8 +1,10 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import numpy as np
+from cube import district_totals, load_cube
+from districts import attach_names, dimension_from, join_on_keys
+from figures import FigureRenderer
 
 # Constants
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
@@ -10,43 +12,23 @@ OUTPUT_DIR = r"d:/UIDAI data hackathon/outputs"
 FIG_DIR = os.path.join(OUTPUT_DIR, "figures")
 os.makedirs(FIG_DIR, exist_ok=True)
 
-MASTERS = {
-    "Enrolment": "enrolment_master.csv",
-    "Demographic": "demographic_master.csv"
-}
+MASTERS = ["Enrolment", "Demographic"]
 
-def load_data():
-    data = {}
-    for name, f in MASTERS.items():
-        path = os.path.join(CLEANED_DIR, f)
-        if os.path.exists(path):
-            print(f"Loading {name}...")
-            df = pd.read_csv(path)
-            # Ensure age columns are numeric
-            cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-            for c in cols:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-            data[name] = df
-    return data
-
-def calculate_uesi(data):
+def calculate_uesi(cube):
     print("Calculating UESI...")
     
     # 1. Aggregate Enrolments by District (Denominator Proxy)
     # We assume Total Adult Enrolments over time ~ Adult Population in system
-    enrol = data['Enrolment']
-    enrol_district = enrol.groupby(['state', 'district'])['age_18_plus'].sum().reset_index()
-    enrol_district.rename(columns={'age_18_plus': 'total_adult_enrolments'}, inplace=True)
+    enrol_district = district_totals(cube, ['Enrolment'], ['age_18_plus'])
+    enrol_district = enrol_district.rename('total_adult_enrolments').reset_index()
     
     # 2. Aggregate Returns/Updates by District (Numerator)
     # We focus on Demographic Updates for Adults as the "Stress" signal
-    demo = data['Demographic']
-    demo_district = demo.groupby(['state', 'district'])['age_18_plus'].sum().reset_index()
-    demo_district.rename(columns={'age_18_plus': 'total_adult_updates'}, inplace=True)
+    demo_district = district_totals(cube, ['Demographic'], ['age_18_plus'])
+    demo_district = demo_district.rename('total_adult_updates').reset_index()
     
-    # 3. Merge
-    merged = pd.merge(enrol_district, demo_district, on=['state', 'district'], how='inner')
+    # 3. Merge (on the district key)
+    merged = join_on_keys(enrol_district, demo_district)
     
     # 4. Calculate Raw UESI (Updates per 1000 Enrolments)
     # Avoid division by zero
@@ -60,10 +42,11 @@ def calculate_uesi(data):
     
     # Sort
     merged = merged.sort_values('UESI_Score', ascending=False)
+    merged = attach_names(merged, dimension_from(cube))
     
     return merged
 
-def plot_uesi_distribution(df):
+def plot_uesi_distribution(df, out_path):
     plt.figure(figsize=(10, 6))
     sns.histplot(df['UESI_Score'], bins=30, kde=True, color='salmon')
     plt.title('Distribution of UESI Scores across Districts')
@@ -71,11 +54,7 @@ def plot_uesi_distribution(df):
     plt.ylabel('Count of Districts')
     plt.axvline(df['UESI_Score'].mean(), color='red', linestyle='--', label='Mean')
     plt.legend()
-    
-    out_path = os.path.join(FIG_DIR, "uesi_distribution.png")
     plt.savefig(out_path)
-    print(f"Saved distribution plot to {out_path}")
-    plt.close()
 
 def save_top_districts(df):
     # Top 20 Stressed
@@ -90,18 +69,22 @@ def save_top_districts(df):
     print(f"Saved full UESI data to {full_path}")
 
 def main():
-    data = load_data()
-    if "Enrolment" not in data or "Demographic" not in data:
+    # Canonical names so spelling drift between sources doesn't drop districts from the join
+    cube = load_cube(MASTERS, canonical=True, cleaned_dir=CLEANED_DIR)
+    if not set(MASTERS) <= set(cube['category']):
         print("Error: Missing required data files.")
         return
         
-    uesi_df = calculate_uesi(data)
+    uesi_df = calculate_uesi(cube)
     
     print("\nTop 5 Stressed Districts:")
     print(uesi_df.head(5))
     
-    plot_uesi_distribution(uesi_df)
-    save_top_districts(uesi_df)
+    with FigureRenderer() as figures:
+        out_path = os.path.join(FIG_DIR, "uesi_distribution.png")
+        figures.submit(plot_uesi_distribution, uesi_df[['UESI_Score']], out_path,
+                       message=f"Saved distribution plot to {out_path}")
+        save_top_districts(uesi_df)
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,14 @@
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import os
+from cube import district_totals, load_cube
+from districts import KEY, attach_names, dimension_from
+from segments import Segments
+from online_resilience import NO_DAY, ResilienceState, to_days
+from figures import FigureRenderer
 
 # Constants
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
@@ -10,96 +16,105 @@ OUTPUT_DIR = r"d:/UIDAI data hackathon/outputs"
 FIG_DIR = os.path.join(OUTPUT_DIR, "figures")
 os.makedirs(FIG_DIR, exist_ok=True)
 
-MASTERS = {
-    "Enrolment": "enrolment_master.csv",
-    "Demographic": "demographic_master.csv",
-    "Biometric": "biometric_master.csv"
-}
+MASTERS = ["Enrolment", "Demographic", "Biometric"]
 
-def load_data():
-    """Load all master datasets with date parsing"""
-    data = {}
-    for name, filename in MASTERS.items():
-        path = os.path.join(CLEANED_DIR, filename)
-        if os.path.exists(path):
-            print(f"Loading {name}...")
-            df = pd.read_csv(path)
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-            data[name] = df
-    return data
+# A spike is a run of days above SPIKE_FACTOR x the district's median daily volume
+SPIKE_FACTOR = 1.5
 
-def calculate_daily_volume(df, category_name):
-    """Calculate total daily volume per district"""
-    age_cols = ['age_0_5', 'age_5_17', 'age_18_plus']
-    available_cols = [col for col in age_cols if col in df.columns]
-    
-    df['total_volume'] = df[available_cols].sum(axis=1)
-    
-    # Group by district and date
-    daily = df.groupby(['state', 'district', 'date'])['total_volume'].sum().reset_index()
-    daily['category'] = category_name
-    
-    return daily
+def calculate_daily_volume(cube, categories=None):
+    """Calculate total daily volume per district (all age buckets of the given categories)"""
+    daily = district_totals(cube, categories, daily=True)
+    return daily.rename('total_volume').reset_index()
 
-def calculate_resilience_metrics(daily_df):
-    """Calculate shock, volatility, and recovery metrics for each district"""
-    results = []
-    
-    for (state, district), group in daily_df.groupby(['state', 'district']):
-        volumes = group['total_volume'].values
-        
-        if len(volumes) < 10:  # Need enough data points
-            continue
-        
-        # Core Metrics
-        median_vol = np.median(volumes)
-        mean_vol = np.mean(volumes)
-        peak_vol = np.max(volumes)
-        std_vol = np.std(volumes)
-        
+def calculate_resilience_metrics(daily_df, events=None):
+    """Calculate shock, volatility, and recovery metrics for each district (events: spike_events() of daily_df)"""
+    # Every district's series in one array, reduced per district over its sorted segment
+    daily_df = daily_df.sort_values([KEY, 'date'], kind='stable')
+    volumes = daily_df['total_volume'].to_numpy(dtype='float64')
+    districts = Segments(daily_df[KEY].to_numpy())
+    
+    # Core Metrics
+    median_vol = districts.median(volumes)
+    mean_vol = districts.mean(volumes)
+    peak_vol = districts.max(volumes)
+    std_vol = districts.std(volumes, mean_vol)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
         # Shock Intensity: How much does the peak exceed normal?
-        shock_intensity = peak_vol / median_vol if median_vol > 0 else 0
+        shock_intensity = np.where(median_vol > 0, peak_vol / median_vol, 0)
         
         # Volatility Score: Coefficient of Variation (normalized std dev)
-        volatility_score = (std_vol / mean_vol * 100) if mean_vol > 0 else 0
-        
-        # Recovery Time: Days to return to median after a spike
-        recovery_days = calculate_recovery_time(volumes, median_vol)
-        
-        # Stability Score (inverse of volatility, 0-100 scale)
-        stability_score = max(0, 100 - volatility_score)
-        
-        results.append({
-            'state': state,
-            'district': district,
-            'median_daily_volume': median_vol,
-            'peak_daily_volume': peak_vol,
-            'shock_intensity': shock_intensity,
-            'volatility_score': volatility_score,
-            'stability_score': stability_score,
-            'recovery_days': recovery_days,
-            'data_points': len(volumes)
-        })
-    
-    return pd.DataFrame(results)
+        volatility_score = np.where(mean_vol > 0, std_vol / mean_vol * 100, 0)
+    
+    # Recovery Time: Days to return to median after a spike
+    if events is None:
+        events = spike_events(daily_df)
+    recovery_days = calculate_recovery_time(events, districts.keys)
+    
+    # Stability Score (inverse of volatility, 0-100 scale)
+    stability_score = np.maximum(0, 100 - volatility_score)
+    
+    results = pd.DataFrame({
+        KEY: districts.keys,
+        'median_daily_volume': median_vol,
+        'peak_daily_volume': peak_vol,
+        'shock_intensity': shock_intensity,
+        'volatility_score': volatility_score,
+        'stability_score': stability_score,
+        'recovery_days': recovery_days,
+        'data_points': districts.counts
+    })
+    
+    # Need enough data points
+    return results[districts.counts >= 10].reset_index(drop=True)
 
-def calculate_recovery_time(volumes, median_vol):
-    """Calculate average recovery time after spikes"""
-    recovery_times = []
-    in_spike = False
-    spike_start = 0
-    
-    for i, vol in enumerate(volumes):
-        if vol > median_vol * 1.5:  # Define spike as 1.5x median
-            if not in_spike:
-                in_spike = True
-                spike_start = i
-        elif in_spike:
-            recovery_times.append(i - spike_start)
-            in_spike = False
-    
-    return np.mean(recovery_times) if recovery_times else 0
+def spike_events(daily_df, factor=SPIKE_FACTOR):
+    """
+    Catalog of spike events across all districts at once: one row per run of
+    consecutive days above factor x the district's median, indexed by
+    (district_key, start_date). recovered is False for a spike still running at
+    the end of the district's series.
+    """
+    daily_df = daily_df.sort_values([KEY, 'date'], kind='stable')
+    volumes = daily_df['total_volume'].to_numpy(dtype='float64')
+    dates = daily_df['date'].to_numpy()
+    districts = Segments(daily_df[KEY].to_numpy())
+    median_vol = districts.median(volumes)
+    
+    baseline = median_vol[districts.ids]
+    spike = volumes > baseline * factor
+    first, last, district, recovered = districts.runs(spike)
+    duration = last - first + 1
+    
+    # Spike days are contiguous per event once non-spike days are dropped
+    offsets = np.r_[0, np.cumsum(duration)[:-1]].astype('int64')
+    if len(first):
+        peak = np.maximum.reduceat(volumes[spike], offsets)
+        excess = np.add.reduceat((volumes - baseline)[spike], offsets)
+    else:
+        peak = excess = np.empty(0)
+    median = median_vol[district]
+    
+    events = pd.DataFrame({
+        KEY: districts.keys[district],
+        'start_date': dates[first],
+        'end_date': dates[last],
+        'duration_days': duration,
+        'peak_volume': peak,
+        'median_daily_volume': median,
+        'peak_to_median': np.divide(peak, median, out=np.full(len(peak), np.nan), where=median > 0),
+        'excess_load': excess,
+        'recovered': recovered
+    })
+    return events.set_index([KEY, 'start_date'])
+
+def calculate_recovery_time(events, keys):
+    """Average duration of the spikes each district recovered from (0 if none), aligned to the sorted keys"""
+    recovered = events[events['recovered']]
+    position = np.searchsorted(keys, recovered.index.get_level_values(KEY).to_numpy())
+    count = np.bincount(position, minlength=len(keys))
+    total_days = np.bincount(position, weights=recovered['duration_days'].to_numpy(dtype='float64'), minlength=len(keys))
+    return np.divide(total_days, count, out=np.zeros(len(keys)), where=count > 0)
 
 def classify_resilience(df):
     """Classify districts into resilience tiers using percentiles"""
@@ -144,7 +159,7 @@ def classify_resilience(df):
     
     return df
 
-def plot_resilience_scatter(df):
+def plot_resilience_scatter(df, out_path, thresholds=None):
     """Create scatter plot of Shock vs Volatility with percentile tiers"""
     plt.figure(figsize=(14, 9))
     
@@ -164,8 +179,7 @@ def plot_resilience_scatter(df):
                        color=colors.get(tier, 'gray'), alpha=0.6, s=80)
     
     # Add percentile threshold lines
-    if 'thresholds' in df.attrs:
-        thresholds = df.attrs['thresholds']
+    if thresholds:
         plt.axvline(thresholds['shock_95'], color='red', linestyle='--', 
                    linewidth=1, alpha=0.5, label=f"95th %ile Shock ({thresholds['shock_95']:.1f})")
         plt.axhline(thresholds['volatility_95'], color='red', linestyle='--', 
@@ -177,20 +191,13 @@ def plot_resilience_scatter(df):
     plt.legend(loc='upper right', fontsize=9)
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
-    
-    out_path = os.path.join(FIG_DIR, "resilience_scatter.png")
     plt.savefig(out_path, dpi=300)
-    plt.close()
-    print(f"Saved scatter plot to {out_path}")
 
-def plot_top_extreme_districts(df, n=20):
+def top_extreme_districts(df, n=20):
+    return df[df['resilience_tier'] == 'Extreme Instability'].sort_values('shock_intensity', ascending=False).head(n)
+
+def plot_top_extreme_districts(extreme, out_path, n=20):
     """Plot top extreme instability districts"""
-    extreme = df[df['resilience_tier'] == 'Extreme Instability'].sort_values('shock_intensity', ascending=False).head(n)
-    
-    if len(extreme) == 0:
-        print("No Extreme Instability districts found")
-        return
-    
     plt.figure(figsize=(14, 10))
     y_pos = np.arange(len(extreme))
     
@@ -203,11 +210,15 @@ def plot_top_extreme_districts(df, n=20):
     plt.title(f'Top {n} Districts: Extreme Operational Instability', fontweight='bold', fontsize=13)
     plt.grid(axis='x', alpha=0.3)
     plt.tight_layout()
-    
-    out_path = os.path.join(FIG_DIR, "top_extreme_districts.png")
     plt.savefig(out_path, dpi=300)
-    plt.close()
-    print(f"Saved extreme districts plot to {out_path}")
+
+def save_spike_events(events, dim):
+    """Spike catalog with district names, indexed by (state, district, start_date) for lookups"""
+    catalog = attach_names(events.reset_index(), dim).set_index(['state', 'district', 'start_date']).sort_index()
+    out_path = os.path.join(OUTPUT_DIR, "spike_events.csv")
+    catalog.to_csv(out_path)
+    print(f"Saved {len(catalog)} spike events ({catalog['recovered'].sum()} recovered) to {out_path}")
+    return catalog
 
 def save_results(df):
     """Save resilience results to CSV with summary statistics"""
@@ -241,31 +252,78 @@ def save_results(df):
         print(f"  95th Percentile Volatility: {thresholds['volatility_95']:.2f}%")
         print(f"  80th Percentile Volatility: {thresholds['volatility_80']:.2f}%")
 
-def main():
-    print("Starting Operational Resilience Analysis...")
-    data = load_data()
+def run_online(cube, reset=False):
+    """
+    Online mode: fold the days the saved per-district state hasn't seen into it
+    (O(1) per district-day, no history replay) and report shock and volatility from it
+    """
+    state = ResilienceState() if reset else ResilienceState.load(CLEANED_DIR)
+    dim = dimension_from(cube)
+    
+    # Only days after each district's own last update can still be new (all days of a new district)
+    keys = cube[KEY].to_numpy(dtype='int64')
+    last_day = np.full(len(keys), NO_DAY, dtype='int64')
+    known = (keys >= 0) & (keys < len(state))
+    last_day[known] = state.last_day[keys[known]]
+    cube = cube[to_days(cube['date']) > last_day]
+    district_daily = calculate_daily_volume(cube, MASTERS)
+    applied = state.add(district_daily[KEY], district_daily['date'], district_daily['total_volume'])
+    print(f"Applied {applied} new district-days; state saved to {state.save(CLEANED_DIR)}")
+    
+    resilience_df = state.metrics()
+    if len(resilience_df) == 0:
+        print("No district has enough days yet")
+        return
+    resilience_df = attach_names(resilience_df, dim)
+    resilience_df = classify_resilience(resilience_df)
     
-    # Combine all categories to get total daily system load
-    all_daily = []
-    for name, df in data.items():
-        daily = calculate_daily_volume(df, name)
-        all_daily.append(daily)
+    out_path = os.path.join(OUTPUT_DIR, "operational_resilience_online.csv")
+    resilience_df.sort_values('shock_intensity', ascending=False).to_csv(out_path, index=False)
+    print(f"Saved online resilience data to {out_path}")
+    print(resilience_df['resilience_tier'].value_counts().to_string())
+
+def main():
+    parser = argparse.ArgumentParser(description="Operational resilience metrics per district")
+    parser.add_argument("--online", action="store_true",
+                        help="Update the saved per-district state with new days only (approximate median)")
+    parser.add_argument("--reset-state", action="store_true", help="With --online, start from an empty state")
+    args = parser.parse_args()
     
-    combined_daily = pd.concat(all_daily, ignore_index=True)
+    print("Starting Operational Resilience Analysis...")
+    # Canonical names so spelling drift between sources doesn't drop districts from the join
+    cube = load_cube(MASTERS, canonical=True, cleaned_dir=CLEANED_DIR)
+    if args.online:
+        run_online(cube, reset=args.reset_state)
+        return
     
-    # Aggregate across categories to get total district load per day
-    district_daily = combined_daily.groupby(['state', 'district', 'date'])['total_volume'].sum().reset_index()
+    # Total district load per day across all categories
+    district_daily = calculate_daily_volume(cube, MASTERS)
     
-    # Calculate metrics
-    resilience_df = calculate_resilience_metrics(district_daily)
+    # Spike events of every district, then metrics (recovery time comes from the events)
+    events = spike_events(district_daily)
+    resilience_df = calculate_resilience_metrics(district_daily, events)
+    dim = dimension_from(cube)
+    resilience_df = attach_names(resilience_df, dim)
     resilience_df = classify_resilience(resilience_df)
     
-    # Visualize
-    plot_resilience_scatter(resilience_df)
-    plot_top_extreme_districts(resilience_df)
-    
-    # Save
-    save_results(resilience_df)
+    # Visualize (rendered in the background while the results are saved)
+    with FigureRenderer() as figures:
+        out_path = os.path.join(FIG_DIR, "resilience_scatter.png")
+        figures.submit(plot_resilience_scatter, resilience_df[['shock_intensity', 'volatility_score', 'resilience_tier']],
+                       out_path, message=f"Saved scatter plot to {out_path}",
+                       thresholds=resilience_df.attrs.get('thresholds'))
+        
+        extreme = top_extreme_districts(resilience_df)
+        if len(extreme) == 0:
+            print("No Extreme Instability districts found")
+        else:
+            out_path = os.path.join(FIG_DIR, "top_extreme_districts.png")
+            figures.submit(plot_top_extreme_districts, extreme[['state', 'district', 'shock_intensity']], out_path,
+                           message=f"Saved extreme districts plot to {out_path}")
+        
+        # Save
+        save_results(resilience_df)
+        save_spike_events(events, dim)
     
     print("\n✅ Operational Resilience Framework Complete!")
 
@@ -3,8 +3,12 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import os
+from geography import canonicalize, load_dictionary
+from districts import KEY, assign_keys, attach_names, join_on_keys, load_dimension
+from figures import FigureRenderer
 
 # Constants
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 OUTPUT_DIR = r"d:/UIDAI data hackathon/outputs"
 FIG_DIR = os.path.join(OUTPUT_DIR, "figures")
 os.makedirs(FIG_DIR, exist_ok=True)
@@ -18,6 +22,17 @@ def load_frameworks():
     
     uesi = pd.read_csv(uesi_path)
     resilience = pd.read_csv(resilience_path)
+
+    # Outputs written before the dictionary existed may still carry raw spellings
+    geo = load_dictionary(CLEANED_DIR)
+    uesi = canonicalize(uesi, geo)
+    resilience = canonicalize(resilience, geo)
+    # Canonical names can fold two raw districts into one; their scores can't just be combined
+    for name, df, stage in [("UESI", uesi, "07"), ("Resilience", resilience, "10")]:
+        repeated = df.duplicated(['state', 'district'])
+        if repeated.any():
+            raise ValueError(f"{name} results have {int(repeated.sum())} district(s) twice under canonical names; "
+                             f"re-run {stage} so they are computed per canonical district")
     
     print(f"Loaded UESI: {len(uesi)} districts")
     print(f"Loaded Resilience: {len(resilience)} districts")
@@ -25,16 +40,18 @@ def load_frameworks():
     return uesi, resilience
 
 def merge_frameworks(uesi, resilience):
-    """Merge UESI and Resilience on state/district"""
+    """Merge UESI and Resilience on the district key"""
     print("\nMerging frameworks...")
     
-    # Merge on state and district
-    merged = pd.merge(
-        uesi[['state', 'district', 'UESI_Score']],
-        resilience[['state', 'district', 'shock_intensity', 'volatility_score', 'resilience_tier']],
-        on=['state', 'district'],
-        how='inner'
+    # Key both tables through the district dimension, join on the key, then put the names back
+    dim = load_dimension(CLEANED_DIR)
+    uesi_keys, dim = assign_keys(uesi, dim)
+    resilience_keys, dim = assign_keys(resilience, dim)
+    merged = join_on_keys(
+        uesi[['UESI_Score']].assign(**{KEY: uesi_keys}),
+        resilience[['shock_intensity', 'volatility_score', 'resilience_tier']].assign(**{KEY: resilience_keys})
     )
+    merged = attach_names(merged, dim)
     
     print(f"Merged data: {len(merged)} districts")
     return merged
@@ -66,10 +83,8 @@ def classify_archetypes(df):
     
     return df
 
-def plot_2x2_matrix(df):
+def plot_2x2_matrix(df, out_path, uesi_median=None):
     """Create 2×2 quadrant plot"""
-    print("\nCreating 2×2 matrix plot...")
-    
     fig, ax = plt.subplots(figsize=(14, 10))
     
     # Define archetype colors and order
@@ -97,7 +112,8 @@ def plot_2x2_matrix(df):
             )
     
     # Add median lines to show quadrants
-    uesi_median = df.attrs.get('uesi_median', df['UESI_Score'].median())
+    if uesi_median is None:
+        uesi_median = df['UESI_Score'].median()
     
     # Determine shock threshold (boundary between High/Extreme and Moderate/Stable)
     shock_threshold = df[df['resilience_tier'].isin(['Moderate Volatility', 'Stable'])]['shock_intensity'].max()
@@ -129,10 +145,7 @@ def plot_2x2_matrix(df):
     ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    out_path = os.path.join(FIG_DIR, "district_archetypes_matrix.png")
     plt.savefig(out_path, dpi=300)
-    plt.close()
-    print(f"Saved matrix plot to {out_path}")
 
 def create_policy_table(df):
     """Create policy recommendation table"""
@@ -269,17 +282,22 @@ def main():
     # Classify
     classified = classify_archetypes(merged)
     
-    # Visualize
-    plot_2x2_matrix(classified)
-    
-    # Policy recommendations
-    policy_df = create_policy_table(classified)
-    
-    # Case studies
-    case_studies = identify_case_studies(classified)
-    
-    # Save and summarize
-    save_results(classified, policy_df, case_studies)
+    with FigureRenderer() as figures:
+        # Visualize (rendered in the background while the tables are built)
+        print("\nCreating 2×2 matrix plot...")
+        out_path = os.path.join(FIG_DIR, "district_archetypes_matrix.png")
+        figures.submit(plot_2x2_matrix, classified[['UESI_Score', 'shock_intensity', 'resilience_tier', 'archetype']],
+                       out_path, message=f"Saved matrix plot to {out_path}",
+                       uesi_median=classified.attrs.get('uesi_median'))
+        
+        # Policy recommendations
+        policy_df = create_policy_table(classified)
+        
+        # Case studies
+        case_studies = identify_case_studies(classified)
+        
+        # Save and summarize
+        save_results(classified, policy_df, case_studies)
     
     print("\n" + "="*70)
     print("✅ DISTRICT ARCHETYPES FRAMEWORK COMPLETE!")
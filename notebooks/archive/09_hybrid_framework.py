@@ -2,9 +2,15 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 import numpy as np
 
+# Shared pipeline helpers live one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from districts import KEY, assign_keys, attach_names, join_on_keys, load_dimension
+
 # Constants
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 OUTPUT_DIR = r"d:/UIDAI data hackathon/outputs"
 FIG_DIR = os.path.join(OUTPUT_DIR, "figures")
 os.makedirs(FIG_DIR, exist_ok=True)
@@ -19,12 +25,13 @@ def load_indices():
     uesi = pd.read_csv(UESI_FILE)
     mucg = pd.read_csv(MUCG_FILE)
     
-    # Keep only relevant columns for merge
-    uesi_cols = ['state', 'district', 'UESI_Score']
-    mucg_cols = ['state', 'district', 'MUCG_Score']
-    
-    merged = pd.merge(uesi[uesi_cols], mucg[mucg_cols], on=['state', 'district'], how='inner')
-    return merged
+    # Join on the district key, names attached afterwards
+    dim = load_dimension(CLEANED_DIR)
+    uesi_keys, dim = assign_keys(uesi, dim)
+    mucg_keys, dim = assign_keys(mucg, dim)
+    merged = join_on_keys(uesi[['UESI_Score']].assign(**{KEY: uesi_keys}),
+                          mucg[['MUCG_Score']].assign(**{KEY: mucg_keys}))
+    return attach_names(merged, dim)
 
 def calculate_alvi(df):
     print("Calculating ALVI...")
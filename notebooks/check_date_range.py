@@ -1,36 +1,29 @@
-import pandas as pd
-import os
+from data_access import load_category
+from schema_registry import CATEGORY_SCHEMAS
 
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
-MASTERS = [
-    "enrolment_master.csv",
-    "demographic_master.csv",
-    "biometric_master.csv"
-]
 
 def check_dates():
     overall_min = None
     overall_max = None
     
-    for f in MASTERS:
-        path = os.path.join(CLEANED_DIR, f)
-        if os.path.exists(path):
-            try:
-                # Read only chunks to be faster if files are huge, but they seem small enough based on prev output
-                df = pd.read_csv(path)
-                if 'date' in df.columns:
-                    df['date'] = pd.to_datetime(df['date'])
-                    min_d = df['date'].min()
-                    max_d = df['date'].max()
-                    
-                    print(f"File: {f}")
-                    print(f"  Start: {min_d.strftime('%Y-%m-%d')}")
-                    print(f"  End:   {max_d.strftime('%Y-%m-%d')}")
-                    
-                    if overall_min is None or min_d < overall_min: overall_min = min_d
-                    if overall_max is None or max_d > overall_max: overall_max = max_d
-            except Exception as e:
-                print(f"Error reading {f}: {e}")
+    for category, schema in CATEGORY_SCHEMAS.items():
+        f = schema["master"]
+        try:
+            # Only the date column is read (Parquet masters skip the rest entirely)
+            df = load_category(category, columns=['date'], cleaned_dir=CLEANED_DIR, report=False)
+            if df is not None and 'date' in df.columns:
+                min_d = df['date'].min()
+                max_d = df['date'].max()
+                
+                print(f"File: {f}")
+                print(f"  Start: {min_d.strftime('%Y-%m-%d')}")
+                print(f"  End:   {max_d.strftime('%Y-%m-%d')}")
+                
+                if overall_min is None or min_d < overall_min: overall_min = min_d
+                if overall_max is None or max_d > overall_max: overall_max = max_d
+        except Exception as e:
+            print(f"Error reading {f}: {e}")
 
     if overall_min and overall_max:
         print("\n--- Overall Data Range ---")
@@ -1,58 +1,57 @@
-import pandas as pd
-import glob
 import os
+from schema_registry import CATEGORY_SCHEMAS
+from lineage import load_ledger
 
-RAW_DIR = r"d:/UIDAI data hackathon/Data"
 CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
 OUTPUT_FILE = "cleaning_report.txt"
 
-# Mapping raw subfolders to cleaned subfolders
-MAPPING = {
-    "api_data_aadhar_enrolment": "enrolment",
-    "api_data_aadhar_demographic": "demographic_updates",
-    "api_data_aadhar_biometric": "biometric_updates"
-}
-
-with open(OUTPUT_FILE, "w") as f:
-    header = f"{'Category':<25} | {'File':<45} | {'Raw Rows':<10} | {'Cleaned Rows':<12} | {'Dropped':<10}\n"
-    f.write(header)
-    print(header.strip())
-    
-    sep = "-" * 110 + "\n"
-    f.write(sep)
-    print(sep.strip())
-
-    total_dropped = 0
-    
-    for raw_sub, cleaned_sub in MAPPING.items():
-        raw_path = os.path.join(RAW_DIR, raw_sub)
-        clean_path = os.path.join(CLEANED_DIR, cleaned_sub)
-        
-        if not os.path.exists(raw_path): continue
-        
-        files = glob.glob(os.path.join(raw_path, "*.csv"))
-        
-        for raw_f in files:
-            filename = os.path.basename(raw_f)
-            clean_f = os.path.join(clean_path, filename)
-            
-            if os.path.exists(clean_f):
-                try:
-                    df_raw = pd.read_csv(raw_f, usecols=[0])
-                    df_clean = pd.read_csv(clean_f, usecols=[0])
-                    
-                    raw_count = len(df_raw)
-                    clean_count = len(df_clean)
-                    dropped = raw_count - clean_count
-                    total_dropped += dropped
-                    
-                    category = cleaned_sub.replace("_updates", "").capitalize()
-                    line = f"{category:<25} | {filename:<45} | {raw_count:<10} | {clean_count:<12} | {dropped:<10}\n"
-                    f.write(line)
-                    print(line.strip())
-                except Exception as e:
-                    print(f"Error reading {filename}: {e}")
-
-    f.write("-" * 110 + "\n")
-    f.write(f"Total Rows Dropped across all files: {total_dropped}\n")
-    print(f"Total Rows Dropped across all files: {total_dropped}")
+# Row counts come from the lineage ledger 01/02/03 write as they run,
+# so no raw or cleaned file has to be re-read here.
+
+def main():
+    ledger = load_ledger(CLEANED_DIR)
+    if not ledger["files"]:
+        print(f"No lineage ledger in {CLEANED_DIR}; run 01-03 (or fused_ingest.py) first.")
+        return
+
+    with open(OUTPUT_FILE, "w") as f:
+        def emit(line):
+            f.write(line + "\n")
+            print(line)
+
+        emit(f"{'Category':<25} | {'File':<45} | {'Raw Rows':<10} | {'Cleaned Rows':<12} | {'Dropped':<10}"
+             f" | {'Duplicates':<10} | {'No Geo':<8} | {'All NaN':<8} | {'Overlap':<8}")
+        emit("-" * 160)
+
+        total_dropped = 0
+
+        for folder, schema in CATEGORY_SCHEMAS.items():
+            entries = sorted((k, v) for k, v in ledger["files"].items() if v.get("category") == folder)
+
+            for key, counts in entries:
+                if "rows_out" not in counts:
+                    continue
+                filename = counts.get("file", os.path.basename(key))
+                raw_count = counts.get("raw_rows", counts["rows_in"])
+                clean_count = counts["rows_out"]
+                dropped = raw_count - clean_count
+                total_dropped += dropped
+
+                emit(f"{schema['label']:<25} | {filename:<45} | {raw_count:<10} | {clean_count:<12} | {dropped:<10}"
+                     f" | {counts['duplicates']:<10} | {counts['missing_geography']:<8}"
+                     f" | {counts['all_nan_metrics']:<8} | {counts.get('cross_file_overlap', '-'):<8}")
+
+        emit("-" * 160)
+        emit(f"Total Rows Dropped across all files: {total_dropped}")
+
+        emit("")
+        emit(f"{'Category':<25} | {'Files':<6} | {'Rows In':<10} | {'Cross-File Overlap':<18} | {'Master Rows':<12}")
+        emit("-" * 85)
+        for folder, schema in CATEGORY_SCHEMAS.items():
+            counts = ledger["categories"].get(folder)
+            if counts:
+                emit(f"{schema['label']:<25} | {counts['files']:<6} | {counts['rows_in']:<10}"
+                     f" | {counts['cross_file_overlap']:<18} | {counts['master_rows']:<12}")
+
+if __name__ == "__main__":
+    main()
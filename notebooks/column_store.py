@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from schema_registry import CATEGORY_SCHEMAS
+from storage import find_table
+
+# Memory-mapped column store: cleaned_data/columns/<category>/<column>.npy
+# Categoricals are stored as their integer codes plus <column>.categories.json,
+# dates as datetime64[ns] (the unit data_access conforms to), nullable counts as
+# int32 values plus a <column>.mask.npy when any are missing. Loaders
+# np.load(mmap_mode='r') only the columns they use and wrap the maps without
+# copying them (codes, dates, values and masks alike; only the category names are
+# read into memory), so startup does no parsing and processes on one machine
+# share the page cache.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+STORE_DIR = "columns"
+META_FILE = "_meta.json"
+
+def store_dir(cleaned_dir, category):
+    return os.path.join(cleaned_dir, STORE_DIR, category)
+
+def remove_store(cleaned_dir, category):
+    root = store_dir(cleaned_dir, category)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+
+def write_column(root, col, series):
+    """Save one column; returns how it was encoded"""
+    path = os.path.join(root, f"{col}.npy")
+    if isinstance(series.dtype, pd.CategoricalDtype) or not (
+            pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)):
+        series = series.astype('category')
+        np.save(path, series.cat.codes.to_numpy())
+        with open(os.path.join(root, f"{col}.categories.json"), "w") as f:
+            json.dump([str(c) for c in series.cat.categories], f)
+        return "category"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        np.save(path, series.to_numpy().astype('datetime64[ns]'))
+        return "date"
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        mask = series.isna().to_numpy()
+        np.save(path, series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0))
+        if mask.any():
+            np.save(os.path.join(root, f"{col}.mask.npy"), mask)
+        return "nullable"
+    np.save(path, series.to_numpy())
+    return "numpy"
+
+def export_store(df, cleaned_dir, category, source_path):
+    """Write df as the category's column store, stamped with the master it came from"""
+    root = store_dir(cleaned_dir, category)
+    tmp = root + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    st = os.stat(source_path)
+    meta = {
+        "rows": len(df),
+        "columns": {col: write_column(tmp, col, df[col]) for col in df.columns},
+        "source": {"path": os.path.basename(source_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    }
+    with open(os.path.join(tmp, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    remove_store(cleaned_dir, category)
+    os.replace(tmp, root)
+    return root
+
+def store_meta(cleaned_dir, category):
+    """The store's metadata if it exists and still matches its master file, else None"""
+    path = os.path.join(store_dir(cleaned_dir, category), META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        meta = json.load(f)
+
+    master = find_table(os.path.join(cleaned_dir, CATEGORY_SCHEMAS[category]["master"]))
+    st = os.stat(master) if master else None
+    if (st is None or os.path.basename(master) != meta["source"]["path"]
+            or st.st_size != meta["source"]["size"] or st.st_mtime_ns != meta["source"]["mtime_ns"]):
+        print(f"  [!] Column store for {category} is older than its master; re-run column_store.py")
+        return None
+    return meta
+
+def open_column(root, col, kind):
+    values = np.load(os.path.join(root, f"{col}.npy"), mmap_mode='r')
+    if kind == "category":
+        with open(os.path.join(root, f"{col}.categories.json")) as f:
+            categories = json.load(f)
+        # validate=False: checking the codes against the categories would read the whole map
+        return pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(categories), validate=False)
+    if kind == "date":
+        # Stores written before dates were kept in nanoseconds hold [D] or [s] (converted with a copy)
+        return values if values.dtype == 'datetime64[ns]' else values.astype('datetime64[ns]')
+    if kind == "nullable":
+        mask_path = os.path.join(root, f"{col}.mask.npy")
+        mask = np.load(mask_path, mmap_mode='r') if os.path.exists(mask_path) else np.zeros(len(values), dtype=bool)
+        return pd.arrays.IntegerArray(values, mask)
+    return values
+
+def load_store(cleaned_dir, category, columns=None):
+    """
+    Frame over the memory-mapped columns of a category (requested columns it lacks
+    are skipped), or None if there is no up-to-date store.
+    """
+    meta = store_meta(cleaned_dir, category)
+    if meta is None:
+        return None
+    root = store_dir(cleaned_dir, category)
+    wanted = meta["columns"] if columns is None else [c for c in columns if c in meta["columns"]]
+    return pd.DataFrame({col: open_column(root, col, meta["columns"][col]) for col in wanted}, copy=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the masters as memory-mapped .npy column stores")
+    parser.parse_args()
+
+    # Imported here: master_store reads stores through this module
+    from master_store import load_master
+    for category, schema in CATEGORY_SCHEMAS.items():
+        path = find_table(os.path.join(CLEANED_DIR, schema["master"]))
+        if not path:
+            continue
+        remove_store(CLEANED_DIR, category)
+        df = load_master(path, cache=False)
+        root = export_store(df, CLEANED_DIR, category, path)
+        print(f"  [EXPORTED] {root} ({len(df)} rows, {len(df.columns)} columns)")
+
+if __name__ == "__main__":
+    main()
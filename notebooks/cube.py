@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import pandas as pd
+from schema_registry import ALL_METRICS, CATEGORY_SCHEMAS
+from master_store import STATS_FILE, dataset_dir
+from data_access import load_masters, master_path
+from geography import DICTIONARY_FILE, canonicalize, load_dictionary
+from districts import KEY, assign_keys, empty_dimension, load_dimension, update_dimension
+
+# Daily aggregate cube: one row per (state, district, date, category, age_bucket)
+# with the summed volume, built once per ingest from the masters into
+# cleaned_data/daily_cube.parquet. Every analysis groups pincode rows up to some
+# subset of these keys, so they all read the cube (a few hundred times smaller
+# than the masters) and roll it up instead.
+# Rows with a missing district or date are kept (as NaN keys) so totals that
+# ignore those keys still match the masters. Each row also carries the district's
+# surrogate key (see districts.py), which per-district roll-ups group on.
+# Keys are only ever added at ingest (03 / fused_ingest / geography.py), for both
+# the raw and the canonical names; the analysis stages just read the dimension.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+CUBE_FILE = "daily_cube.parquet"
+META_FILE = "daily_cube.json"
+CUBE_COLUMNS = ['state', 'district', 'date'] + ALL_METRICS
+DIMENSIONS = ['state', 'district', KEY, 'date', 'category', 'age_bucket']
+MEASURE = 'volume'
+
+def aggregate_frame(df, label):
+    """Collapse one category's rows to the cube's grain (long format: one row per age bucket)"""
+    keys = [c for c in ['state', 'district', 'date'] if c in df.columns]
+    metrics = [c for c in ALL_METRICS if c in df.columns]
+    daily = df.groupby(keys, observed=True, dropna=False)[metrics].sum().reset_index()
+    long = daily.melt(id_vars=keys, value_vars=metrics, var_name='age_bucket', value_name=MEASURE)
+    long['category'] = label
+    return long
+
+def build_cube(frames, cleaned_dir=None, save_keys=True):
+    """
+    Cube from {label: frame}, e.g. the masters or uploaded files. District keys
+    come from the stored dimension in cleaned_dir (new districts are added to it
+    unless save_keys is False), or are numbered for these frames alone if it is None.
+    """
+    parts = [aggregate_frame(df, label) for label, df in frames.items()]
+    if not parts:
+        return pd.DataFrame(columns=DIMENSIONS + [MEASURE])
+    cube = pd.concat(parts, ignore_index=True)
+    if cleaned_dir is None:
+        cube[KEY] = assign_keys(cube, empty_dimension())[0]
+    elif save_keys:
+        cube[KEY] = update_dimension(cube, cleaned_dir)
+    else:
+        cube[KEY] = assign_keys(cube, load_dimension(cleaned_dir))[0]
+    for col in ['state', 'district', 'category', 'age_bucket']:
+        cube[col] = cube[col].astype('category')
+    # Counts sum to whole numbers; keep floats only if a master has fractional counts
+    volume = cube[MEASURE].astype('float64')
+    cube[MEASURE] = volume.astype('int64') if (volume % 1 == 0).all() else volume
+    return cube[DIMENSIONS + [MEASURE]]
+
+def source_stamp(cleaned_dir):
+    """Size/mtime of every master and partition index the cube is built from"""
+    stamp = {}
+    for category in CATEGORY_SCHEMAS:
+        path = master_path(category, cleaned_dir)
+        stats = os.path.join(dataset_dir(cleaned_dir, category), STATS_FILE)
+        stamp[category] = {
+            "master": [os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns] if path else None,
+            "partitions": os.stat(stats).st_mtime_ns if os.path.exists(stats) else None
+        }
+    return stamp
+
+def save_cube(cube, cleaned_dir, stamp):
+    path = os.path.join(cleaned_dir, CUBE_FILE)
+    cube.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    with open(os.path.join(cleaned_dir, META_FILE), "w") as f:
+        json.dump({"rows": len(cube), "columns": list(cube.columns), "sources": stamp}, f, indent=2)
+    return path
+
+def cube_is_fresh(cleaned_dir, stamp=None):
+    meta_path = os.path.join(cleaned_dir, META_FILE)
+    if not os.path.exists(meta_path) or not os.path.exists(os.path.join(cleaned_dir, CUBE_FILE)):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    # A cube written with another layout (e.g. before district keys) is rebuilt too
+    return meta.get("columns") == DIMENSIONS + [MEASURE] and meta["sources"] == (stamp or source_stamp(cleaned_dir))
+
+def key_canonical_districts(df, cleaned_dir):
+    """Add keys for the canonical names of df's districts, so canonical_cube() never has to"""
+    if not os.path.exists(os.path.join(cleaned_dir, DICTIONARY_FILE)) or len(df) == 0:
+        return
+    geo = load_dictionary(cleaned_dir)
+    pairs = df[['state', 'district']].drop_duplicates()
+    update_dimension(canonicalize(pairs.reset_index(drop=True), geo), cleaned_dir)
+
+def refresh_cube(cleaned_dir, force=False, save=True):
+    """
+    Rebuild the cube from the masters unless it is already up to date. Returns the cube.
+    With save=False (the analysis stages) nothing is written: a stale cube is built
+    in memory with keys from the stored dimension.
+    """
+    stamp = source_stamp(cleaned_dir)
+    if not force and cube_is_fresh(cleaned_dir, stamp):
+        return pd.read_parquet(os.path.join(cleaned_dir, CUBE_FILE))
+    frames = load_masters(columns=CUBE_COLUMNS, cleaned_dir=cleaned_dir, report=False)
+    if not save:
+        print("  [!] The cube is older than the masters; using an unsaved copy (re-run 03 or cube.py to update it)")
+        return build_cube(frames, cleaned_dir, save_keys=False)
+    cube = build_cube(frames, cleaned_dir)
+    key_canonical_districts(cube, cleaned_dir)
+    path = save_cube(cube, cleaned_dir, stamp)
+    rows = sum(len(df) for df in frames.values())
+    print(f"  [CUBE] {path}: {rows:,} master rows -> {len(cube):,} cube rows")
+    return cube
+
+def canonical_cube(cube, geo, cleaned_dir=CLEANED_DIR):
+    """
+    Map state/district to canonical names (and their keys, read from the stored
+    dimension) and re-aggregate the districts that merge
+    """
+    if geo is None or len(cube) == 0:
+        return cube
+    cube = canonicalize(cube.copy(), geo)
+    cube[KEY] = assign_keys(cube, load_dimension(cleaned_dir))[0]
+    cube = cube.groupby(DIMENSIONS, observed=True, dropna=False)[MEASURE].sum().reset_index()
+    return cube
+
+def load_cube(categories=None, canonical=False, cleaned_dir=CLEANED_DIR):
+    """
+    The cube (built in memory if a master changed since it was saved), optionally
+    limited to some categories (display labels) and with canonical geography.
+    Read-only: the cube and the district keys are only written at ingest.
+    """
+    cube = refresh_cube(cleaned_dir, save=False)
+    if categories is not None:
+        cube = cube[cube['category'].isin(categories)].reset_index(drop=True)
+    if canonical:
+        cube = canonical_cube(cube, load_dictionary(cleaned_dir), cleaned_dir)
+    return cube
+
+def rollup(cube, keys, categories=None, buckets=None, columns=None):
+    """
+    Summed volume grouped by keys (any of DIMENSIONS, plus 'month'), over the
+    given categories and age buckets (default all). columns= moves one key
+    ('category' or 'age_bucket') into the columns. Rows with a missing key are
+    left out, as in a plain groupby.
+    """
+    mask = pd.Series(True, index=cube.index)
+    if KEY in keys:
+        mask &= cube[KEY] >= 0
+    if categories is not None:
+        mask &= cube['category'].isin(categories)
+    if buckets is not None:
+        mask &= cube['age_bucket'].isin(buckets)
+    cube = cube[mask]
+
+    keys = list(keys) + ([columns] if columns else [])
+    groups = [cube['date'].dt.to_period('M').dt.to_timestamp().rename('month') if k == 'month' else cube[k]
+              for k in keys]
+    result = cube[MEASURE].groupby(groups, observed=True).sum()
+    if columns:
+        result = result.unstack(columns)
+        result.columns = list(result.columns)
+    return result
+
+def district_totals(cube, categories=None, buckets=None, daily=False):
+    """Volume per district key, or per (district key, date) with daily=True"""
+    return rollup(cube, [KEY] + (['date'] if daily else []), categories, buckets)
+
+def state_totals(cube, categories=None, buckets=None):
+    return rollup(cube, ['state'], categories, buckets)
+
+def daily_totals(cube, categories=None, buckets=None):
+    return rollup(cube, ['date'], categories, buckets)
+
+def monthly_totals(cube, categories=None, buckets=None):
+    """Volume per calendar month (indexed by the first day of the month)"""
+    return rollup(cube, ['month'], categories, buckets)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the daily aggregate cube from the masters")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the cube is up to date")
+    args = parser.parse_args()
+
+    cube = refresh_cube(CLEANED_DIR, force=args.force)
+    print(f"Cube: {len(cube):,} rows, {cube.memory_usage(deep=True).sum() / 1e6:,.1f} MB")
+
+if __name__ == "__main__":
+    main()
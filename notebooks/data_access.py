@@ -0,0 +1,87 @@
+import os
+import pandas as pd
+from schema_registry import CATEGORY_SCHEMAS, GEO_CATEGORICAL, apply_schema, category_for_label, schema_dtypes
+from storage import find_table
+from master_store import load_master
+from geography import canonicalize, load_dictionary
+
+# One way for the analysis scripts and the dashboard to get at the masters.
+# Whatever the source (column store, partitioned dataset, CSV/Parquet master,
+# an uploaded CSV), frames come back the same: only the requested columns, in
+# the requested order, state/district categorical, counts nullable Int32,
+# 'date' datetime64[ns]; optionally with canonical geography.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+
+def resolve_category(name):
+    """Registry key for a category key or display label ("Enrolment", ...)"""
+    if name in CATEGORY_SCHEMAS:
+        return name
+    category = category_for_label(name)
+    if category is None:
+        raise ValueError(f"Unknown category: {name}")
+    return category
+
+def master_path(category, cleaned_dir=CLEANED_DIR):
+    """The category's master on disk, or None if it hasn't been built"""
+    return find_table(os.path.join(cleaned_dir, CATEGORY_SCHEMAS[resolve_category(category)]["master"]))
+
+def conform(df, category, columns=None, geo=None):
+    """Bring a loaded frame to the shared layout (see module comment)"""
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    # Only cast what isn't typed yet: memory-mapped columns stay mapped
+    declared = schema_dtypes(category)
+    pending = [c for c in df.columns if c in declared and df[c].dtype != declared[c]]
+    if pending:
+        df = df.copy(deep=False)
+        typed = apply_schema(df[pending].copy(), category)
+        for col in pending:
+            df[col] = typed[col]
+    if 'date' in df.columns and df['date'].dtype != 'datetime64[ns]':
+        df['date'] = df['date'].astype('datetime64[ns]')
+    if geo is not None and all(c in df.columns for c in GEO_CATEGORICAL):
+        df = canonicalize(df, geo)
+    return df
+
+def load_category(category, columns=None, states=None, start=None, end=None,
+                  canonical=False, cleaned_dir=CLEANED_DIR, report=True, geo=None):
+    """
+    One master as a conformed frame, or None if it doesn't exist. Only `columns`
+    are read; states/start/end filter rows (dates inclusive) and are pushed down
+    to the partitioned dataset when there is one. canonical=True maps state and
+    district through the geography dictionary.
+    """
+    category = resolve_category(category)
+    path = master_path(category, cleaned_dir)
+    if path is None:
+        return None
+    if canonical and geo is None:
+        geo = load_dictionary(cleaned_dir)
+    df = load_master(path, columns=columns, states=states, start=start, end=end, report=report)
+    return conform(df, category, columns, geo)
+
+def load_masters(categories=None, columns=None, states=None, start=None, end=None,
+                 canonical=False, cleaned_dir=CLEANED_DIR, report=True):
+    """
+    load_category() for several categories (default: all), keyed by display label.
+    Categories without a master are left out.
+    """
+    categories = list(CATEGORY_SCHEMAS) if categories is None else [resolve_category(c) for c in categories]
+    # Canonical names so spelling drift between sources doesn't split districts
+    geo = load_dictionary(cleaned_dir) if canonical else None
+
+    data = {}
+    for category in categories:
+        label = CATEGORY_SCHEMAS[category]["label"]
+        if master_path(category, cleaned_dir) is None:
+            continue
+        print(f"Loading {label}...")
+        data[label] = load_category(category, columns, states, start, end,
+                                    cleaned_dir=cleaned_dir, report=report, geo=geo)
+    return data
+
+def read_upload(file, category, columns=None):
+    """An uploaded CSV (path or file object) of one category as a conformed frame"""
+    category = resolve_category(category)
+    usecols = None if columns is None else (lambda c: c in columns)
+    return conform(pd.read_csv(file, usecols=usecols, low_memory=False), category, columns)
@@ -0,0 +1,47 @@
+import pandas as pd
+
+# Candidate formats, most likely first. Raw drops are DD-MM-YYYY (see audit_notes.md),
+# everything written by 01 onwards is ISO YYYY-MM-DD.
+DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%Y/%m/%d', '%d.%m.%Y']
+
+def detect_date_format(values, sample_size=1000):
+    """
+    Pick the candidate format that parses the most of a sample of unique values.
+    Returns None if no candidate parses anything (caller falls back to dayfirst inference).
+    """
+    uniques = pd.Series(pd.unique(pd.Series(values).dropna().astype(str)))[:sample_size]
+    if len(uniques) == 0:
+        return None
+
+    best_fmt, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = pd.to_datetime(uniques, format=fmt, errors='coerce').notna().sum()
+        if count > best_count:
+            best_fmt, best_count = fmt, count
+        if count == len(uniques):
+            break
+    return best_fmt
+
+def parse_dates(values, date_format=None):
+    """
+    Parse a date column to datetime64, detecting the format once.
+    Only the unique strings are parsed (~120 distinct days across millions of rows);
+    the result is broadcast back with a take on the factorized codes.
+    Unparseable values become NaT.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques).astype(str)
+    if date_format is None:
+        date_format = detect_date_format(uniques)
+
+    if date_format:
+        parsed = pd.to_datetime(uniques, format=date_format, errors='coerce')
+    else:
+        parsed = pd.to_datetime(uniques, dayfirst=True, errors='coerce')
+
+    result = pd.DatetimeIndex(parsed).take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(result, index=values.index, name=values.name)
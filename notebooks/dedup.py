@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+
+# Row deduplication on fixed-width row hashes instead of whole wide frames.
+# drop_duplicates() on string columns builds a hash table over every value of
+# every column; here each row is reduced to one 64-bit key (or two for 128-bit)
+# and only those keys are compared. Rows flagged as duplicates are checked
+# against the row they supposedly repeat, so a hash collision can never drop data.
+
+# Second key for 128-bit fingerprints (pandas requires exactly 16 characters)
+HASH_KEY_HI = "uidai-dedup-key2"
+
+def hashable_frame(df):
+    """
+    View of df whose row hashes don't depend on dtype details that differ between
+    files/chunks: counts hash as float64 (Int32 5 == float 5.0, NA == NaN) and
+    dates as datetime64[ns].
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            s = s.astype('datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            s = s.astype('float64')
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+def comparable(s):
+    """s as a numpy array whose values compare equal across files/chunks (see hashable_frame)"""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.to_numpy(dtype='datetime64[ns]')
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.to_numpy(dtype='float64', na_value=np.nan)
+    return s.to_numpy(dtype=object)
+
+def same_rows(a, b):
+    """Row-by-row equality of two equally long frames over a's columns, NA equal to NA"""
+    same = np.ones(len(a), dtype=bool)
+    for col in a.columns:
+        x, y = comparable(a[col]), comparable(b[col])
+        same &= (x == y) | (pd.isna(x) & pd.isna(y))
+    return same
+
+def row_keys(df, bits=64):
+    """One uint64 key per row, or an (n, 2) uint64 array for bits=128"""
+    frame = hashable_frame(df)
+    lo = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    if bits == 64:
+        return lo
+    hi = pd.util.hash_pandas_object(frame, index=False, hash_key=HASH_KEY_HI).to_numpy()
+    return np.column_stack([hi, lo])
+
+def key_index(keys):
+    if keys.ndim == 1:
+        return pd.Index(keys)
+    return pd.MultiIndex.from_arrays([keys[:, 0], keys[:, 1]])
+
+def find_collisions(df, index, dup_mask):
+    """Positions of rows flagged as duplicates that don't actually equal their first occurrence"""
+    dup_pos = np.flatnonzero(dup_mask)
+    if len(dup_pos) == 0:
+        return dup_pos
+
+    codes, _ = pd.factorize(index)
+    _, first_pos = np.unique(codes, return_index=True)
+    orig_pos = first_pos[codes[dup_pos]]
+
+    return dup_pos[~same_rows(df.iloc[dup_pos], df.iloc[orig_pos])]
+
+def drop_duplicates(df, bits=64, verify=True):
+    """
+    Hash-based equivalent of df.drop_duplicates() (keep='first', order preserved).
+    With verify=True any collision falls back to an exact drop_duplicates.
+    """
+    if len(df) == 0:
+        return df
+
+    index = key_index(row_keys(df, bits))
+    dup_mask = index.duplicated(keep='first')
+
+    if verify and len(find_collisions(df, index, dup_mask)):
+        print("  [!] Row hash collision, falling back to exact deduplication")
+        return df.drop_duplicates()
+    # take() returns an independent frame, like drop_duplicates() does
+    return df.take(np.flatnonzero(~dup_mask))
+
+class KeySet:
+    """
+    Growing open-addressing hash set of uint64 row keys, each stored with a uint32
+    value (the row it stands for). Keys live in one flat array and are looked up or
+    inserted a whole array at a time with vectorized linear probing; row keys are
+    already uniform hashes, so their low bits pick the slot. 12 bytes a slot, with
+    the table kept between 3/8 and 3/4 full (16-32 bytes a key).
+    """
+
+    EMPTY = np.uint32(0xFFFFFFFF)
+    MAX_LOAD = 0.75
+
+    def __init__(self, capacity=1 << 16):
+        self.keys = np.zeros(capacity, dtype='uint64')
+        self.values = np.full(capacity, self.EMPTY, dtype='uint32')
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.values.nbytes
+
+    def lookup(self, keys):
+        """Value stored for each key, EMPTY where the key isn't in the set"""
+        mask = len(self.keys) - 1
+        slot = (keys & np.uint64(mask)).astype('int64')
+        found = np.full(len(keys), self.EMPTY, dtype='uint32')
+        pending = np.arange(len(keys))
+        while len(pending):
+            s = slot[pending]
+            stored = self.values[s]
+            empty = stored == self.EMPTY
+            hit = ~empty & (self.keys[s] == keys[pending])
+            found[pending[hit]] = stored[hit]
+            pending = pending[~empty & ~hit]
+            slot[pending] = (slot[pending] + 1) & mask
+        return found
+
+    def insert(self, keys, values):
+        """Add keys (distinct and not in the set yet) with their values"""
+        if self.size + len(keys) > self.MAX_LOAD * len(self.keys):
+            capacity = len(self.keys)
+            while self.size + len(keys) > self.MAX_LOAD * capacity:
+                capacity *= 2
+            used = self.values != self.EMPTY
+            old_keys, old_values = self.keys[used], self.values[used]
+            self.keys = np.zeros(capacity, dtype='uint64')
+            self.values = np.full(capacity, self.EMPTY, dtype='uint32')
+            self.place(old_keys, old_values)
+        self.place(keys, values)
+        self.size += len(keys)
+
+    def place(self, keys, values):
+        mask = len(self.keys) - 1
+        slot = (keys & np.uint64(mask)).astype('int64')
+        pending = np.arange(len(keys))
+        while len(pending):
+            s = slot[pending]
+            free = self.values[s] == self.EMPTY
+            # One winner per free slot; the others find it taken next round and move on
+            _, first = np.unique(s[free], return_index=True)
+            won = np.flatnonzero(free)[first]
+            self.keys[s[won]] = keys[pending[won]]
+            self.values[s[won]] = values[pending[won]]
+            taken = pending[~free]
+            slot[taken] = (slot[taken] + 1) & mask
+            left = np.ones(len(pending), dtype=bool)
+            left[won] = False
+            pending = pending[left]
+
+class StreamingDeduplicator:
+    """
+    Drops rows already seen in earlier chunks (keep='first' across the stream).
+    Each kept row's 64-bit key goes into one KeySet (16-32 bytes a row) together
+    with its number among the kept rows. A key seen before is checked against the
+    kept row it points to, so the returned chunks are referenced (not copied) until
+    the deduplicator goes away; the callers here hold them anyway. A row that only
+    collides with an earlier one is kept (and so are any later copies of it), so a
+    collision can never drop data.
+    """
+
+    def __init__(self):
+        self.seen = KeySet()
+        self.kept_chunks = []
+        self.offsets = []
+        self.kept = 0
+        self.rows_in = 0
+        self.dropped = 0
+
+    def earlier_rows_match(self, rows, refs):
+        """Whether each of rows equals the kept row numbered refs"""
+        chunk_ids = np.searchsorted(self.offsets, refs, side='right') - 1
+        order = np.argsort(chunk_ids, kind='stable')
+        chunk_ids, refs = chunk_ids[order], refs[order].astype('int64')
+        starts = np.flatnonzero(np.r_[True, chunk_ids[1:] != chunk_ids[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        earlier = pd.concat([self.kept_chunks[chunk_ids[s]].iloc[refs[s:e] - self.offsets[chunk_ids[s]]]
+                             for s, e in zip(starts, ends)])
+        same = np.empty(len(order), dtype=bool)
+        same[order] = same_rows(rows.iloc[order], earlier.reindex(columns=rows.columns))
+        return same
+
+    def filter(self, chunk):
+        """Return the rows of chunk not seen before"""
+        self.rows_in += len(chunk)
+        if len(chunk) == 0:
+            return chunk
+
+        keys = row_keys(chunk)
+        index = pd.Index(keys)
+        dup_mask = index.duplicated(keep='first')
+        if len(find_collisions(chunk, index, dup_mask)):
+            raise ValueError("Row hash collision inside a chunk; rerun with exact deduplication")
+
+        first = np.flatnonzero(~dup_mask)
+        refs = self.seen.lookup(keys[first])
+        known = refs != KeySet.EMPTY
+        repeat = np.zeros(len(first), dtype=bool)
+        if known.any():
+            hits = np.flatnonzero(known)
+            repeat[hits] = self.earlier_rows_match(chunk.iloc[first[hits]], refs[hits])
+            if (known & ~repeat).any():
+                print(f"  [!] {int((known & ~repeat).sum())} row hash collision(s) across chunks, keeping those rows")
+
+        keep = first[~repeat]
+        if self.kept + len(keep) >= KeySet.EMPTY:
+            raise ValueError("Too many rows for a StreamingDeduplicator")
+        # Colliding rows are kept but their key already points at the earlier row
+        fresh = ~known[~repeat]
+        self.seen.insert(keys[keep[fresh]], (self.kept + np.flatnonzero(fresh)).astype('uint32'))
+
+        out = chunk.take(keep)
+        self.kept_chunks.append(out)
+        self.offsets.append(self.kept)
+        self.kept += len(keep)
+        self.dropped += len(chunk) - len(keep)
+        return out
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import pandas as pd
+
+# District dimension: a stable int32 surrogate key for every (state, district)
+# pair, kept in cleaned_data/district_keys.csv next to the masters. Keys are
+# assigned at ingest (when the cube is built, and for canonical names when the
+# geography dictionary is) and are never renumbered: pairs not seen before are
+# appended after the existing ones, so key k is always row k of the table.
+# Joins and groupbys run on the key, with per-district values held in arrays
+# indexed by it; state/district names are attached only when a result is written.
+# Rows with a missing state or district get key -1.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+DIMENSION_FILE = "district_keys.csv"
+KEY = 'district_key'
+MISSING_KEY = -1
+
+def empty_dimension():
+    return pd.DataFrame({KEY: pd.Series(dtype='int32'),
+                         'state': pd.Series(dtype='object'),
+                         'district': pd.Series(dtype='object')})
+
+def load_dimension(cleaned_dir=CLEANED_DIR):
+    """The stored key table (empty if nothing has been keyed yet)"""
+    path = os.path.join(cleaned_dir, DIMENSION_FILE)
+    if not os.path.exists(path):
+        return empty_dimension()
+    return pd.read_csv(path, dtype={KEY: 'int32', 'state': 'object', 'district': 'object'},
+                       keep_default_na=False)
+
+def save_dimension(dim, cleaned_dir=CLEANED_DIR):
+    path = os.path.join(cleaned_dir, DIMENSION_FILE)
+    dim.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+def distinct_pairs(df):
+    """
+    Each row's index into the distinct (state, district) pairs of df (-1 where
+    either is missing), and those pairs as two string arrays. Rows only go through
+    category code arithmetic, as in geography.canonicalize.
+    """
+    state = df['state'].astype('category')
+    district = df['district'].astype('category')
+    s_codes = state.cat.codes.to_numpy(dtype='int64')
+    d_codes = district.cat.codes.to_numpy(dtype='int64')
+    n_districts = max(len(district.cat.categories), 1)
+
+    missing = (s_codes < 0) | (d_codes < 0)
+    row_codes, uniques = pd.factorize(np.where(missing, -1, s_codes * n_districts + d_codes))
+    valid = uniques >= 0
+    # Re-number so -1 marks missing rows and 0..n-1 index the valid pairs
+    renumber = np.full(len(uniques), -1, dtype='int64')
+    renumber[valid] = np.arange(valid.sum())
+    states = state.cat.categories.take(uniques[valid] // n_districts).astype(str).to_numpy(dtype=object)
+    districts = district.cat.categories.take(uniques[valid] % n_districts).astype(str).to_numpy(dtype=object)
+    return renumber[row_codes], states, districts
+
+def assign_keys(df, dim):
+    """
+    Key of every row of df (int32 array) and the dimension extended with the
+    pairs it didn't have yet (new keys in name order, after the existing ones)
+    """
+    if len(df) == 0:
+        return np.empty(0, dtype='int32'), dim
+    row_codes, states, districts = distinct_pairs(df)
+    known = pd.MultiIndex.from_arrays([dim['state'].astype(object), dim['district'].astype(object)])
+    pairs = pd.MultiIndex.from_arrays([states, districts])
+    positions = known.get_indexer(pairs)
+
+    new = positions < 0
+    if new.any():
+        added = pd.DataFrame({'state': states[new], 'district': districts[new]}).sort_values(['state', 'district'])
+        added.insert(0, KEY, np.arange(len(dim), len(dim) + len(added), dtype='int32'))
+        dim = pd.concat([dim, added], ignore_index=True)
+        dim[KEY] = dim[KEY].astype('int32')
+        positions[new] = np.arange(len(dim) - len(added), len(dim))[np.argsort(added.index.to_numpy())]
+
+    pair_keys = np.append(positions, MISSING_KEY).astype('int32')
+    return pair_keys[row_codes], dim
+
+def update_dimension(df, cleaned_dir=CLEANED_DIR):
+    """assign_keys() against the stored dimension, saving it if pairs were added. Returns the row keys."""
+    dim = load_dimension(cleaned_dir)
+    keys, extended = assign_keys(df, dim)
+    if len(extended) > len(dim):
+        save_dimension(extended, cleaned_dir)
+        print(f"  [DISTRICTS] {len(extended) - len(dim)} new district keys ({len(extended)} in total)")
+    return keys
+
+def dimension_from(df):
+    """Key/name table of a keyed frame (e.g. the cube), for attach_names()"""
+    dim = df.loc[df[KEY] >= 0, [KEY, 'state', 'district']].drop_duplicates(KEY)
+    return dim.sort_values(KEY).reset_index(drop=True)
+
+def key_array(values, size, fill=0):
+    """A per-district Series indexed by key as a dense float array indexed by key"""
+    arr = np.full(size, fill, dtype='float64')
+    arr[values.index.to_numpy()] = values.to_numpy(dtype='float64')
+    return arr
+
+def join_on_keys(left, right):
+    """
+    Inner join of two frames with a KEY column (unique in right) in left's row
+    order, like pd.merge(how='inner', validate='many_to_one'): right's rows are
+    found through an array indexed by key instead of a hash table. A key repeated
+    in right raises ValueError; aggregate those rows before joining.
+    """
+    left_keys = left[KEY].to_numpy(dtype='int64')
+    right_keys = right[KEY].to_numpy(dtype='int64')
+    repeated = pd.Index(right_keys[right_keys >= 0]).duplicated()
+    if repeated.any():
+        raise ValueError(f"join_on_keys: {int(repeated.sum())} district key(s) repeat in the right-hand frame")
+    size = int(max(left_keys.max(initial=-1), right_keys.max(initial=-1))) + 1
+    position = np.full(size + 1, -1, dtype='int64')   # last slot catches missing (-1) keys
+    position[right_keys] = np.arange(len(right_keys))
+    position[-1] = -1
+    matched = position[left_keys]
+    keep = matched >= 0
+
+    joined = left[keep].reset_index(drop=True)
+    taken = right.drop(columns=KEY).take(matched[keep]).reset_index(drop=True)
+    for col in taken.columns:
+        joined[col] = taken[col]
+    return joined
+
+def attach_names(df, dim, keep_key=False):
+    """df with state and district (categorical) put in front, looked up by key in dim"""
+    size = int(max(dim[KEY].to_numpy().max(initial=-1), df[KEY].to_numpy().max(initial=-1))) + 2
+    out = {}
+    for col in ['state', 'district']:
+        names = dim[col].astype(str)
+        categories = pd.Index(sorted(set(names)))
+        codes = np.full(size, -1, dtype='int64')   # last slot: missing key
+        codes[dim[KEY].to_numpy()] = categories.get_indexer(names)
+        out[col] = pd.Categorical.from_codes(codes[df[KEY].to_numpy()], categories=categories)
+
+    rest = df if keep_key else df.drop(columns=KEY)
+    named = rest.copy()
+    named.insert(0, 'district', out['district'])
+    named.insert(0, 'state', out['state'])
+    return named
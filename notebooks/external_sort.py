@@ -0,0 +1,150 @@
+import os
+import numpy as np
+import pandas as pd
+from dedup import drop_duplicates
+from storage import iter_table
+
+# Out-of-core sort/merge for masters that don't fit in memory.
+# Inputs are cut into sorted runs of at most buffer_rows rows on disk, then the
+# runs are k-way merged in blocks: only rows whose key is below every run's
+# current frontier are emitted, so equal keys (and therefore duplicate rows)
+# always leave in the same batch and are deduplicated there.
+# Peak memory is about buffer_rows rows (plus one key group), whatever the input size.
+SORT_KEY = ['state', 'district', 'date']
+MIN_BLOCK_ROWS = 1000
+
+# Helper columns carried through the runs
+SOURCE_COL = '_source'
+DATE_KEY_COL = '_date_key'
+
+def sort_key(df):
+    """Columns to sort/compare on: strings for geography, int64 for dates (NaT sorts last)"""
+    key = [c for c in SORT_KEY if c in df.columns and c != 'date']
+    return key + ([DATE_KEY_COL] if DATE_KEY_COL in df.columns else [])
+
+def prepare_run(df, source):
+    """Plain strings instead of per-chunk categoricals, so runs compare and concat alike"""
+    for col in ['state', 'district']:
+        if col in df.columns:
+            df[col] = df[col].astype(object).where(df[col].notna(), '')
+    if 'date' in df.columns:
+        dates = df['date'].astype('datetime64[ns]')
+        df[DATE_KEY_COL] = np.where(dates.isna(), np.iinfo('int64').max, dates.to_numpy().view('int64'))
+    df[SOURCE_COL] = np.int32(source)
+    return df.sort_values(sort_key(df), kind='mergesort')
+
+def common_dtypes(seen):
+    """
+    One dtype per column across all runs (chunks can type counts differently).
+    Categoricals stay plain strings: each chunk has its own category set.
+    """
+    dtypes = {}
+    for col, kinds in seen.items():
+        kinds = set(kinds)
+        if any(isinstance(k, pd.CategoricalDtype) for k in kinds):
+            dtypes[col] = 'object'
+        elif len(kinds) == 1:
+            dtypes[col] = kinds.pop()
+        elif all(pd.api.types.is_numeric_dtype(k) for k in kinds):
+            dtypes[col] = 'float64'
+        else:
+            dtypes[col] = 'object'
+    return dtypes
+
+def write_runs(paths, run_dir, buffer_rows, category=None):
+    """
+    Sort every input into runs of at most buffer_rows rows under run_dir.
+    Returns (run paths, rows per input, dtype per output column).
+    """
+    runs = []
+    rows = []
+    seen = {}
+    for source, path in enumerate(paths):
+        n = 0
+        for chunk in iter_table(path, buffer_rows, category=category):
+            n += len(chunk)
+            for col, dtype in chunk.dtypes.items():
+                seen.setdefault(col, []).append(dtype)
+            run = prepare_run(chunk, source)
+            run_path = os.path.join(run_dir, f"run_{len(runs):05d}.parquet")
+            run.to_parquet(run_path, index=False)
+            runs.append(run_path)
+        rows.append(n)
+    return runs, rows, common_dtypes(seen)
+
+class RunReader:
+    """Buffered cursor over one sorted run"""
+
+    def __init__(self, path, block_rows):
+        import pyarrow.parquet as pq
+        self.batches = pq.ParquetFile(path).iter_batches(batch_size=block_rows)
+        self.buffer = None
+        self.exhausted = False
+        self.read_block()
+
+    def read_block(self):
+        """Append the next block to the buffer; marks the run exhausted at its end"""
+        try:
+            block = next(self.batches).to_pandas()
+        except StopIteration:
+            self.exhausted = True
+            return
+        self.buffer = block if self.buffer is None or len(self.buffer) == 0 else \
+            pd.concat([self.buffer, block], ignore_index=True)
+
+    def last_key(self, key):
+        return tuple(self.buffer[key].iloc[-1])
+
+    def take_below(self, key, bound):
+        """Pop and return buffered rows whose key is strictly below bound"""
+        mask = np.zeros(len(self.buffer), dtype=bool)
+        equal = np.ones(len(self.buffer), dtype=bool)
+        for col, value in zip(key, bound):
+            values = self.buffer[col].to_numpy()
+            mask |= equal & (values < value)
+            equal &= values == value
+        out = self.buffer[mask]
+        self.buffer = self.buffer[~mask].reset_index(drop=True)
+        return out
+
+def merge_runs(runs, buffer_rows):
+    """
+    k-way merge of sorted runs. Yields (batch, dropped): sorted batches with full
+    duplicates removed (the copy from the earliest input is kept) and the input
+    index of every dropped row.
+    """
+    block_rows = max(buffer_rows // max(len(runs), 1), MIN_BLOCK_ROWS)
+    readers = [RunReader(path, block_rows) for path in runs]
+    readers = [r for r in readers if r.buffer is not None]
+    if not readers:
+        return
+    key = sort_key(readers[0].buffer)
+
+    while readers:
+        live = [r for r in readers if not r.exhausted]
+        if not live:
+            pieces = [r.buffer for r in readers]
+            readers = []
+        else:
+            # Nothing unread can sort below the smallest last-buffered key
+            bound = min(r.last_key(key) for r in live)
+            pieces = [r.take_below(key, bound) for r in readers]
+            if not any(len(p) for p in pieces):
+                # Every buffered row shares the bound key: read further into the runs that set it
+                for r in live:
+                    if r.last_key(key) == bound:
+                        r.read_block()
+                continue
+            for r in live:
+                if len(r.buffer) == 0:
+                    r.read_block()
+            readers = [r for r in readers if not (r.exhausted and len(r.buffer) == 0)]
+
+        pieces = [p for p in pieces if len(p)]
+        if not pieces:
+            continue
+        batch = pd.concat(pieces, ignore_index=True)
+        batch = batch.sort_values(key, kind='mergesort')
+        kept = drop_duplicates(batch.drop(columns=[SOURCE_COL]))
+        dropped = batch[SOURCE_COL].drop(kept.index).to_numpy()
+        yield kept.drop(columns=[DATE_KEY_COL], errors='ignore'), dropped
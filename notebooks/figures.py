@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib
+
+# Figure rendering off the numeric path.
+# Stages hand a render function, the small aggregated frame it plots and the
+# output path to a FigureRenderer and carry on; figures are drawn in a process
+# pool with the headless Agg backend and waited for only when the stage ends.
+# Render functions must be module-level (picklable) and take (data, out_path, **params).
+FIGURE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Rendered PNGs are also kept in <figure dir>/.figure_cache/<key>.png, keyed by a
+# hash of the data, the parameters, the render function's code and the matplotlib
+# version. A figure whose key is cached is copied instead of re-rendered, or left
+# alone if the output already is that copy. Least recently used entries are
+# evicted past MAX_FIGURE_CACHE_MB.
+FIGURE_CACHE_DIR = ".figure_cache"
+INDEX_FILE = "_index.json"
+MAX_FIGURE_CACHE_MB = 200
+
+def use_agg():
+    matplotlib.use('Agg')
+
+def render(func, data, out_path, params):
+    import matplotlib.pyplot as plt
+    try:
+        func(data, out_path, **params)
+    finally:
+        plt.close('all')
+    return out_path
+
+def hash_value(h, value):
+    """Feed a plot input into h: frames/arrays by content, containers recursively"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        h.update(repr((type(value).__name__, list(frame.columns), [str(t) for t in frame.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=repr):
+            h.update(repr(k).encode())
+            hash_value(h, value[k])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            hash_value(h, item)
+    elif hasattr(value, '__dict__'):
+        h.update(type(value).__qualname__.encode())
+        hash_value(h, vars(value))
+    else:
+        h.update(repr(value).encode())
+
+def hash_code(h, code):
+    """Bytecode and constants; nested code objects (comprehensions) recursively, as their repr holds an address"""
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            hash_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+def figure_key(func, data, params):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{func.__module__}.{func.__qualname__}|{matplotlib.__version__}".encode())
+    hash_code(h, func.__code__)
+    hash_value(h, data)
+    hash_value(h, params)
+    return h.hexdigest()
+
+class FigureCache:
+    """Content-addressed PNG store for one figure directory"""
+
+    def __init__(self, fig_dir, max_mb=MAX_FIGURE_CACHE_MB):
+        self.root = os.path.join(fig_dir, FIGURE_CACHE_DIR)
+        self.max_bytes = max_mb * 1e6
+        path = os.path.join(self.root, INDEX_FILE)
+        self.index = {"entries": {}, "outputs": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.index = json.load(f)
+
+    def entry_path(self, key):
+        return os.path.join(self.root, f"{key}.png")
+
+    def lookup(self, key):
+        entry = self.index["entries"].get(key)
+        if entry is None or not os.path.exists(self.entry_path(key)):
+            return None
+        entry["last_used"] = time.time()
+        return entry
+
+    def output_is(self, out_path, key):
+        """True if out_path is still the file last written from key"""
+        out = self.index["outputs"].get(os.path.abspath(out_path))
+        if out is None or out["key"] != key or not os.path.exists(out_path):
+            return False
+        st = os.stat(out_path)
+        return out["size"] == st.st_size and out["mtime_ns"] == st.st_mtime_ns
+
+    def record_output(self, out_path, key):
+        st = os.stat(out_path)
+        self.index["outputs"][os.path.abspath(out_path)] = {"key": key, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def restore(self, key, out_path):
+        shutil.copyfile(self.entry_path(key), out_path)
+        self.record_output(out_path, key)
+
+    def store(self, key, out_path):
+        os.makedirs(self.root, exist_ok=True)
+        shutil.copyfile(out_path, self.entry_path(key))
+        self.index["entries"][key] = {"bytes": os.path.getsize(out_path), "last_used": time.time()}
+        self.record_output(out_path, key)
+        self.evict()
+
+    def evict(self):
+        entries = self.index["entries"]
+        total = sum(e["bytes"] for e in entries.values())
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["bytes"]
+            del entries[key]
+            if os.path.exists(self.entry_path(key)):
+                os.remove(self.entry_path(key))
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, INDEX_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+class FigureRenderer:
+    """
+    Queue of figures for one stage. With workers <= 1 figures are drawn inline
+    (still with Agg); the pool is only started once a figure actually needs
+    rendering. Use as a context manager so every figure is written before the
+    stage returns. cache=False always re-renders.
+    """
+
+    def __init__(self, workers=None, cache=True):
+        self.workers = FIGURE_WORKERS if workers is None else workers
+        self.cache = cache
+        use_agg()
+        self.pool = None
+        self.caches = {}
+        self.pending = []
+
+    def figure_cache(self, out_path):
+        fig_dir = os.path.dirname(os.path.abspath(out_path))
+        if fig_dir not in self.caches:
+            self.caches[fig_dir] = FigureCache(fig_dir)
+        return self.caches[fig_dir]
+
+    def submit(self, func, data, out_path, message=None, **params):
+        """Render func(data, out_path, **params); message is printed once the file is written"""
+        key = None
+        if self.cache:
+            key = figure_key(func, data, params)
+            cache = self.figure_cache(out_path)
+            if cache.lookup(key):
+                if not cache.output_is(out_path, key):
+                    cache.restore(key, out_path)
+                print(f"{message or 'Saved ' + os.path.basename(out_path)} (unchanged, not re-rendered)")
+                return
+
+        if self.workers <= 1:
+            render(func, data, out_path, params)
+            self.finish(out_path, key, message)
+            return
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=use_agg)
+        self.pending.append((self.pool.submit(render, func, data, out_path, params), key, message))
+
+    def finish(self, out_path, key, message):
+        if key is not None:
+            self.figure_cache(out_path).store(key, out_path)
+        print(message or f"Saved {os.path.basename(out_path)}")
+
+    def wait(self):
+        """Block until every queued figure is written (re-raises a render error)"""
+        pending, self.pending = self.pending, []
+        for future, key, message in pending:
+            self.finish(future.result(), key, message)
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            for cache in self.caches.values():
+                cache.save()
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
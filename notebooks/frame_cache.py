@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import time
+import uuid
+import pandas as pd
+from manifest import file_hash
+from storage import read_table, table_columns, table_format
+
+# On-disk cache of parsed, typed CSV masters: cleaned_data/frame_cache/*.feather
+# An entry is keyed by the source's absolute path and is valid while its size and
+# mtime match, or (if only those changed) its content hash still does. Entries keep
+# the columns that have been asked for so far; a request for columns the entry
+# lacks re-reads the CSV once for the union. The least recently used entries are
+# evicted when the cache grows past MAX_CACHE_MB.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+CACHE_DIR = "frame_cache"
+INDEX_FILE = "_index.json"
+MAX_CACHE_MB = 2048
+
+def cache_dir(cleaned_dir):
+    return os.path.join(cleaned_dir, CACHE_DIR)
+
+def load_index(root):
+    path = os.path.join(root, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_index(root, index):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, INDEX_FILE)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def remove_entry(root, index, key):
+    entry = index.pop(key, None)
+    if entry and os.path.exists(os.path.join(root, entry["file"])):
+        os.remove(os.path.join(root, entry["file"]))
+
+def valid_entry(root, index, path):
+    """The entry for path if it still describes the file on disk, else None (stale entries are dropped)"""
+    key = os.path.abspath(path)
+    entry = index.get(key)
+    if entry is None:
+        return None
+    st = os.stat(path)
+    if entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+        # Touched but maybe not changed (copied, re-saved): compare contents
+        if entry["size"] != st.st_size or file_hash(path) != entry["hash"]:
+            remove_entry(root, index, key)
+            return None
+        entry["mtime_ns"] = st.st_mtime_ns
+    if not os.path.exists(os.path.join(root, entry["file"])):
+        index.pop(key)
+        return None
+    return entry
+
+def evict(root, index, max_bytes):
+    """Drop least recently used entries until the cache fits in max_bytes. Returns how many went."""
+    evicted = 0
+    total = sum(e["bytes"] for e in index.values())
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+        if total <= max_bytes:
+            break
+        total -= entry["bytes"]
+        remove_entry(root, index, key)
+        evicted += 1
+    return evicted
+
+def store_frame(root, index, path, df, available):
+    key = os.path.abspath(path)
+    previous = index.get(key)
+    st = os.stat(path)
+    filename = f"{uuid.uuid4().hex[:12]}.feather"
+    os.makedirs(root, exist_ok=True)
+    df.reset_index(drop=True).to_feather(os.path.join(root, filename))
+
+    content_hash = previous["hash"] if previous else file_hash(path)
+    remove_entry(root, index, key)
+    index[key] = {
+        "file": filename,
+        "hash": content_hash,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "columns": list(df.columns),
+        "available": available,
+        "bytes": os.path.getsize(os.path.join(root, filename)),
+        "last_used": time.time()
+    }
+
+def cached_read(path, columns=None, report=False, max_mb=MAX_CACHE_MB):
+    """
+    read_table() through the cache. Only CSV tables are cached; Parquet already
+    loads typed and column-projected.
+    """
+    if table_format(path) != "csv":
+        return read_table(path, columns=columns, report=report)
+
+    root = cache_dir(os.path.dirname(path))
+    index = load_index(root)
+    entry = valid_entry(root, index, path)
+    available = entry["available"] if entry else table_columns(path)
+    wanted = available if columns is None else [c for c in columns if c in available]
+
+    label = os.path.splitext(os.path.basename(path))[0]
+    if entry and set(wanted) <= set(entry["columns"]):
+        df = pd.read_feather(os.path.join(root, entry["file"]), columns=wanted)
+        entry["last_used"] = time.time()
+        save_index(root, index)
+        if report:
+            print(f"  Frame cache ({label}): {len(df)} rows, {len(df.columns)} columns, no CSV parse")
+        return df
+
+    # Miss: parse once for everything this entry has served plus the new columns
+    read_cols = wanted if entry is None else [c for c in available if c in set(wanted) | set(entry["columns"])]
+    df = read_table(path, columns=read_cols, report=report)
+    store_frame(root, index, path, df, available)
+    evicted = evict(root, index, max_mb * 1e6)
+    save_index(root, index)
+    if evicted:
+        print(f"  Frame cache: evicted {evicted} least recently used entr{'y' if evicted == 1 else 'ies'}")
+    return df[wanted]
+
+def invalidate(cleaned_dir, sources=None):
+    """Drop the entries whose source file name contains any of sources (all entries if None)"""
+    root = cache_dir(cleaned_dir)
+    index = load_index(root)
+    keys = [k for k in index if sources is None or any(s in os.path.basename(k) for s in sources)]
+    for key in keys:
+        remove_entry(root, index, key)
+    save_index(root, index)
+    return keys
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache of parsed CSV masters (Feather)")
+    parser.add_argument("--invalidate", nargs="*", metavar="NAME",
+                        help="Drop entries whose source file name contains NAME (all entries if none given)")
+    parser.add_argument("--max-mb", type=float, default=None,
+                        help=f"Evict least recently used entries down to this size (default limit {MAX_CACHE_MB} MB)")
+    args = parser.parse_args()
+
+    root = cache_dir(CLEANED_DIR)
+    if args.invalidate is not None:
+        for key in invalidate(CLEANED_DIR, args.invalidate or None):
+            print(f"  [INVALIDATED] {key}")
+    if args.max_mb is not None:
+        index = load_index(root)
+        print(f"  Evicted {evict(root, index, args.max_mb * 1e6)} entries")
+        save_index(root, index)
+
+    index = load_index(root)
+    for key, entry in sorted(index.items(), key=lambda item: -item[1]["last_used"]):
+        print(f"  {os.path.basename(key)}: {len(entry['columns'])} columns, {entry['bytes'] / 1e6:,.1f} MB, "
+              f"last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))}")
+    print(f"{len(index)} entries, {sum(e['bytes'] for e in index.values()) / 1e6:,.1f} MB in {root}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import pandas as pd
+import glob
+import os
+import argparse
+import importlib
+from parallel import run_tasks
+from schema_registry import CATEGORY_SCHEMAS, apply_schema
+from dedup import StreamingDeduplicator
+from storage import DEFAULT_FORMAT, FORMATS, find_table, write_table
+from manifest import describe_file, fingerprint, load_manifest, manifest_key, pipeline_lock, save_manifest
+from master_store import remove_partitioned
+from cube import refresh_cube
+from lineage import file_key, load_ledger, merge_lineage, save_ledger
+
+# Fused replacement for 01 -> 02 -> 03: each raw file is streamed in chunks through
+# rename, date parse, numeric coercion, dedup and geography drop, and the master is
+# written directly. No cleaned_data/<folder> files are written or re-read; only the
+# cleaned (typed) rows of a category are held together, never a whole raw file.
+# Raw files are recorded in the manifest like 01 does, so unchanged ones aren't rehashed.
+DATA_DIR = r"d:/UIDAI data hackathon/Data"
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+
+# Stage scripts start with a digit, so they can only be imported by name
+standardization = importlib.import_module("01_schema_standardization")
+cleaning = importlib.import_module("02_data_cleaning")
+merging = importlib.import_module("03_data_merging")
+
+def ingest_file(filepath, config, folder, chunk_size=standardization.CHUNK_SIZE):
+    """
+    One raw file -> cleaned frame, read chunk_size rows at a time with the dtypes
+    and date format pinned by a first pass (as 01 --stream does). Duplicates are
+    dropped across the file's chunks. Returns (frame, drop counts, raw columns).
+    """
+    metrics = CATEGORY_SCHEMAS[folder]["metrics"]
+    dtypes, date_format = standardization.infer_stream_dtypes(filepath, config, chunk_size)
+    original_cols = list(pd.read_csv(filepath, nrows=0).columns)
+
+    dedup = StreamingDeduplicator()
+    parts = []
+    totals = {}
+    for chunk in pd.read_csv(filepath, chunksize=chunk_size, dtype=dtypes, low_memory=False):
+        chunk = standardization.standardize_frame(chunk, config, date_format)
+        # Same typing 02 gets from read_table, so the drop counts match the staged pipeline
+        chunk = apply_schema(chunk, folder)
+        chunk, stats = cleaning.clean_frame(chunk, metrics, dedup=dedup, report=False)
+        parts.append(chunk)
+        for step, n in stats.items():
+            totals[step] = totals.get(step, 0) + n
+
+    if not parts:
+        # Header-only file
+        df = apply_schema(standardization.standardize_frame(pd.read_csv(filepath, nrows=0), config), folder)
+        df, totals = cleaning.clean_frame(df, metrics, report=False)
+    else:
+        # Chunks have their own category lists; re-type the file as a whole
+        df = apply_schema(pd.concat(parts, ignore_index=True), folder)
+    cleaning.report_drops(totals)
+    return df, totals, original_cols
+
+def ingest_category(name, config, fmt=DEFAULT_FORMAT, previous=None, raw_entries=None, force=False,
+                    chunk_size=standardization.CHUNK_SIZE):
+    """
+    Raw files of one category -> master.
+    Returns (master manifest entry, ledger update, raw manifest entries);
+    (None, None, {}) if nothing was merged.
+    """
+    folder = standardization.FOLDER_MAP.get(config["subfolder"], "misc")
+    schema = CATEGORY_SCHEMAS[folder]
+    print(f"\n--- Ingesting {name} ---")
+
+    files = sorted(glob.glob(os.path.join(DATA_DIR, config["subfolder"], "*.csv")))
+    if not files:
+        print("  No files found!")
+        return None, None, {}
+
+    raw_entries = raw_entries or {}
+    inputs = {manifest_key(f): fingerprint(f, raw_entries.get(manifest_key(f))) for f in files}
+    master_path = find_table(os.path.join(CLEANED_DIR, schema["master"]))
+    if (not force and previous and master_path
+            and previous.get("inputs") == inputs and previous.get("format") == fmt
+            and fingerprint(master_path, previous) == previous["hash"]):
+        print(f"  [SKIP] Raw files unchanged since last ingest ({previous['rows']} rows in {master_path})")
+        return previous, None, {}
+
+    dfs = []
+    keys = []
+    file_stats = {}
+    raw_updates = {}
+    for f in files:
+        print(f"\nCleaning {os.path.basename(f)}...")
+        try:
+            df, stats, original_cols = ingest_file(f, config, folder, chunk_size)
+            dfs.append(df)
+            keys.append(file_key(folder, f))
+            file_stats[keys[-1]] = {"file": os.path.basename(f), "raw_rows": stats["rows_in"], **stats}
+            # An entry 01 wrote for the same content stays as it is (it also records 01's output)
+            old = raw_entries.get(manifest_key(f))
+            if not old or old["hash"] != inputs[manifest_key(f)]:
+                raw_updates[manifest_key(f)] = describe_file(f, stats["rows_in"], original_cols, inputs[manifest_key(f)])
+        except Exception as e:
+            print(f"  [ERROR] {e}")
+
+    if not dfs:
+        return None, None, raw_updates
+
+    print()
+    master_df, master_stats = merging.build_master(dfs, folder)
+    os.makedirs(CLEANED_DIR, exist_ok=True)
+    output_path = write_table(master_df, os.path.join(CLEANED_DIR, schema["master"]), fmt)
+    # A partitioned copy from an earlier 03 --partition run would now be stale
+    remove_partitioned(CLEANED_DIR, folder)
+    print(f"  Saved master to: {output_path}")
+    print(f"  Final Master Rows: {len(master_df)}")
+
+    entry = describe_file(output_path, len(master_df), master_df.columns)
+    entry.update({"inputs": inputs, "format": fmt})
+
+    lineage = merging.category_lineage(folder, keys, master_stats)
+    for key, counts in file_stats.items():
+        lineage["files"][key].update(counts)
+    return entry, lineage, raw_updates
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-pass raw -> master ingest (replaces 01/02/03)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Ingest up to this many categories at the same time (default 1)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                        help=f"Storage format for the master files (default {DEFAULT_FORMAT})")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every master, ignoring the manifest")
+    parser.add_argument("--chunk-size", type=int, default=standardization.CHUNK_SIZE,
+                        help=f"Raw rows parsed at a time (default {standardization.CHUNK_SIZE})")
+    args = parser.parse_args()
+    with pipeline_lock(CLEANED_DIR, "fused_ingest"):
+        ingest_all(args)
+
+def ingest_all(args):
+    """Ingest every category whose raw files changed since the last run"""
+    manifest = load_manifest(CLEANED_DIR)
+    ledger = load_ledger(CLEANED_DIR)
+
+    categories = list(standardization.SCHEMA_MAPPINGS.items())
+    folders = [standardization.FOLDER_MAP.get(config["subfolder"], "misc") for _, config in categories]
+    jobs = [(name, config, args.format, manifest["masters"].get(folder), manifest["raw"], args.force,
+             args.chunk_size)
+            for (name, config), folder in zip(categories, folders)]
+
+    workers = min(args.workers, len(jobs))
+    for folder, (log, (entry, lineage, raw_updates)) in zip(folders, run_tasks(ingest_category, jobs, workers)):
+        print(log, end="")
+        if entry:
+            manifest["masters"][folder] = entry
+        manifest["raw"].update(raw_updates)
+        merge_lineage(ledger, lineage)
+
+    save_manifest(manifest, CLEANED_DIR)
+    save_ledger(ledger, CLEANED_DIR)
+    refresh_cube(CLEANED_DIR)
+    print("\nIngest Complete.")
+
+if __name__ == "__main__":
+    main()
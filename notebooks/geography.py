@@ -0,0 +1,291 @@
+import re
+import os
+import argparse
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+# Canonical geography dictionary.
+# The three sources spell some states/districts differently ("Bangalore Urban",
+# "BANGALORE  URBAN", "Bengaluru Urban"...), and the ['state','district'] inner
+# joins in 07/10/12 silently drop every district whose spelling drifts. The
+# dictionary is built once from the masters and maps every raw (state, district)
+# variant to a canonical name and integer geo_id. Loaders apply it to the
+# categorical codes (one lookup per distinct pair), never to rows.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+DICTIONARY_FILE = "geo_dictionary.csv"
+PINCODE_FILE = "geo_pincodes.csv"
+
+# Character n-grams for fuzzy candidates, and the Jaccard similarity above which
+# two names are treated as the same place. A fuzzy match also needs at least
+# PINCODE_OVERLAP of the smaller pincode set to be shared, and compatible
+# numbers/qualifiers ("North 24 Parganas" is never "South 24 Parganas").
+NGRAM = 3
+FUZZY_THRESHOLD = 0.6
+PINCODE_OVERLAP = 0.5
+QUALIFIERS = {'north', 'south', 'east', 'west', 'central', 'urban', 'rural', 'new', 'old',
+              'upper', 'lower', 'nagar', 'city'}
+
+def normalize_name(name):
+    """Case, punctuation and whitespace-insensitive form of a place name"""
+    name = str(name).lower().replace('&', ' and ')
+    return re.sub(r'[^a-z0-9]+', ' ', name).strip()
+
+def tokens_compatible(a, b):
+    """
+    Names with different numbers, or with different qualifier words on both sides,
+    are different places ("North 24 Parganas" vs "South 24 Parganas").
+    """
+    ta, tb = set(a.split()), set(b.split())
+    if {t for t in ta if t.isdigit()} != {t for t in tb if t.isdigit()}:
+        return False
+    qa, qb = ta & QUALIFIERS, tb & QUALIFIERS
+    return not (qa and qb and qa != qb)
+
+def pincodes_agree(a, b):
+    """Pincode evidence for a fuzzy match (no evidence either way if a side has none)"""
+    if not a or not b:
+        return True
+    return len(a & b) >= PINCODE_OVERLAP * min(len(a), len(b))
+
+def ngrams(text, n=NGRAM):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+class NgramIndex:
+    """Inverted n-gram index: candidates are only names sharing at least one n-gram"""
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.grams = {}
+
+    def add(self, key, text):
+        grams = ngrams(text)
+        self.grams[key] = grams
+        for g in grams:
+            self.postings[g].add(key)
+
+    def candidates(self, text, threshold=FUZZY_THRESHOLD):
+        """(similarity, key) of indexed names with n-gram Jaccard >= threshold, best first"""
+        grams = ngrams(text)
+        shared = defaultdict(int)
+        for g in grams:
+            for key in self.postings.get(g, ()):
+                shared[key] += 1
+        scored = [(n / (len(grams) + len(self.grams[key]) - n), key) for key, n in shared.items()]
+        return sorted([c for c in scored if c[0] >= threshold], key=lambda c: (-c[0], c[1]))
+
+def resolve_names(variants, threshold=FUZZY_THRESHOLD):
+    """
+    Cluster raw name variants of one block (all states, or the districts of one state).
+    variants: {raw name: (rows, set of pincodes)}. Names with the same normalised form
+    always merge; otherwise a name merges into a more frequent fuzzy candidate with
+    compatible numbers/qualifiers and agreeing pincodes. The canonical spelling of a cluster
+    is its most frequent raw variant. Returns ({raw: canonical}, [fuzzy merges]).
+    """
+    # Group exact normalised matches first
+    groups = {}
+    for raw, (rows, pins) in variants.items():
+        key = normalize_name(raw)
+        g = groups.setdefault(key, {"rows": 0, "pins": set(), "raws": []})
+        g["rows"] += rows
+        g["pins"] |= pins
+        g["raws"].append((rows, raw))
+
+    index = NgramIndex()
+    clusters = {}
+    assigned = {}
+    fuzzy = []
+    # Most frequent names become canonical first, rarer ones attach to them
+    for key in sorted(groups, key=lambda k: (-groups[k]["rows"], k)):
+        g = groups[key]
+        target = None
+        for score, cand in index.candidates(key, threshold):
+            if (tokens_compatible(key, cand)
+                    and pincodes_agree(g["pins"], clusters[cand]["pins"])):
+                target = cand
+                fuzzy.append((key, cand, score))
+                break
+        if target is None:
+            target = key
+            index.add(key, key)
+            clusters[key] = {"pins": set(), "raws": []}
+        clusters[target]["pins"] |= g["pins"]
+        clusters[target]["raws"] += g["raws"]
+        assigned[key] = target
+
+    canonical = {}
+    for key, c in clusters.items():
+        canonical[key] = max(c["raws"], key=lambda r: (r[0], r[1]))[1]
+    mapping = {raw: canonical[assigned[normalize_name(raw)]] for raw in variants}
+    fuzzy = [(canonical[cand], key, score) for key, cand, score in fuzzy]
+    return mapping, fuzzy
+
+def collect_variants(frames):
+    """Rows and pincodes per raw (state, district) pair across all frames"""
+    parts = []
+    for df in frames:
+        cols = [c for c in ['state', 'district', 'pincode'] if c in df.columns]
+        part = df[cols].dropna(subset=['state', 'district'])
+        if 'pincode' not in part.columns:
+            part = part.assign(pincode=pd.NA)
+        parts.append(part.groupby(['state', 'district', 'pincode'], observed=True, dropna=False)
+                     .size().rename('rows').reset_index())
+    pairs = pd.concat(parts, ignore_index=True)
+    pairs['state'] = pairs['state'].astype(str)
+    pairs['district'] = pairs['district'].astype(str)
+    return pairs.groupby(['state', 'district', 'pincode'], dropna=False)['rows'].sum().reset_index()
+
+def build_dictionary(frames, threshold=FUZZY_THRESHOLD):
+    """
+    Build (dictionary, pincodes) from frames with state/district(/pincode) columns.
+    dictionary: raw_state, raw_district, state, district, geo_id, rows
+    pincodes:   pincode, geo_id, districts (canonical districts seen with it), share
+    """
+    pairs = collect_variants(frames)
+
+    def block_variants(df, col):
+        variants = {}
+        for name, grp in df.groupby(col):
+            variants[name] = (int(grp['rows'].sum()), set(grp['pincode'].dropna().astype(int)))
+        return variants
+
+    state_map, fuzzy = resolve_names(block_variants(pairs, 'state'), threshold)
+    pairs['canon_state'] = pairs['state'].map(state_map)
+
+    district_map = {}
+    for state, block in pairs.groupby('canon_state'):
+        mapping, merges = resolve_names(block_variants(block, 'district'), threshold)
+        for raw_state in block['state'].unique():
+            for raw, canon in mapping.items():
+                district_map[(raw_state, raw)] = canon
+        fuzzy += [(f"{state} / {c}", raw, score) for c, raw, score in merges]
+    pairs['canon_district'] = [district_map[(s, d)] for s, d in zip(pairs['state'], pairs['district'])]
+
+    canon = pairs[['canon_state', 'canon_district']].drop_duplicates().sort_values(['canon_state', 'canon_district'])
+    canon['geo_id'] = np.arange(1, len(canon) + 1, dtype='int32')
+    pairs = pairs.merge(canon, on=['canon_state', 'canon_district'])
+
+    dictionary = (pairs.groupby(['state', 'district', 'canon_state', 'canon_district', 'geo_id'])['rows']
+                  .sum().reset_index()
+                  .rename(columns={'state': 'raw_state', 'district': 'raw_district',
+                                   'canon_state': 'state', 'canon_district': 'district'}))
+
+    # Pincode -> district consistency: each pincode should belong to one canonical district
+    pins = pairs.dropna(subset=['pincode']).groupby(['pincode', 'geo_id'])['rows'].sum().reset_index()
+    pins['share'] = pins['rows'] / pins.groupby('pincode')['rows'].transform('sum')
+    pins['districts'] = pins.groupby('pincode')['geo_id'].transform('size')
+    pincodes = (pins.sort_values(['pincode', 'rows'], ascending=[True, False])
+                .drop_duplicates('pincode')[['pincode', 'geo_id', 'districts', 'share']])
+    pincodes['pincode'] = pincodes['pincode'].astype('int64')
+
+    return dictionary, pincodes, fuzzy
+
+def save_dictionary(dictionary, pincodes, directory):
+    os.makedirs(directory, exist_ok=True)
+    dictionary.to_csv(os.path.join(directory, DICTIONARY_FILE), index=False)
+    pincodes.to_csv(os.path.join(directory, PINCODE_FILE), index=False)
+
+def load_dictionary(directory):
+    """The saved raw -> canonical table, or None (with a note) if it hasn't been built"""
+    path = os.path.join(directory, DICTIONARY_FILE)
+    if not os.path.exists(path):
+        print(f"  [!] No geography dictionary in {directory}; joins use raw names (run geography.py)")
+        return None
+    # Keep names like "NA" as strings
+    return pd.read_csv(path, keep_default_na=False, dtype={'raw_state': str, 'raw_district': str,
+                                                           'state': str, 'district': str})
+
+def lookup_pairs(dictionary, states, districts):
+    """
+    Canonical (state, district) for each distinct raw pair. Pairs not in the
+    dictionary fall back to a normalised-name match, else are kept as they are.
+    """
+    exact = {(s, d): (cs, cd) for s, d, cs, cd in
+             zip(dictionary['raw_state'], dictionary['raw_district'], dictionary['state'], dictionary['district'])}
+    norm_state = {normalize_name(s): cs for s, cs in zip(dictionary['raw_state'], dictionary['state'])}
+    norm_pair = {(cs, normalize_name(d)): cd for cs, d, cd in
+                 zip(dictionary['state'], dictionary['raw_district'], dictionary['district'])}
+
+    out_states, out_districts = [], []
+    for s, d in zip(states, districts):
+        hit = exact.get((s, d))
+        if hit is None:
+            cs = norm_state.get(normalize_name(s), s)
+            hit = (cs, norm_pair.get((cs, normalize_name(d)), d))
+        out_states.append(hit[0])
+        out_districts.append(hit[1])
+    return out_states, out_districts
+
+def canonicalize(df, dictionary):
+    """
+    Replace state/district with their canonical names (categorical, in place) and return df.
+    The lookup runs once per distinct (state, district) code pair; rows only go
+    through integer code arithmetic and a take().
+    """
+    if dictionary is None or not {'state', 'district'} <= set(df.columns) or len(df) == 0:
+        return df
+
+    state = df['state'].astype('category')
+    district = df['district'].astype('category')
+    s_codes = state.cat.codes.to_numpy(dtype='int64')
+    d_codes = district.cat.codes.to_numpy(dtype='int64')
+    n_districts = max(len(district.cat.categories), 1)
+
+    missing = (s_codes < 0) | (d_codes < 0)
+    pair = np.where(missing, -1, s_codes * n_districts + d_codes)
+    row_codes, uniques = pd.factorize(pair)
+    valid = uniques >= 0
+
+    raw_states = state.cat.categories.take(uniques[valid] // n_districts).astype(str)
+    raw_districts = district.cat.categories.take(uniques[valid] % n_districts).astype(str)
+    canon_states, canon_districts = lookup_pairs(dictionary, raw_states, raw_districts)
+
+    # Every frame shares the dictionary's category lists, so concat keeps them categorical
+    state_cats = pd.Index(sorted(set(dictionary['state']) | set(canon_states)))
+    district_cats = pd.Index(sorted(set(dictionary['district']) | set(canon_districts)))
+
+    for col, names, cats in [('state', canon_states, state_cats), ('district', canon_districts, district_cats)]:
+        unique_codes = np.full(len(uniques), -1, dtype='int64')
+        unique_codes[valid] = cats.get_indexer(names)
+        df[col] = pd.Categorical.from_codes(unique_codes[row_codes], categories=cats)
+
+    remapped = sum(s != cs or d != cd for s, d, cs, cd in
+                   zip(raw_states, raw_districts, canon_states, canon_districts))
+    if remapped:
+        print(f"  Geography: {remapped} raw state/district variants mapped to canonical names")
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the canonical geography dictionary from the masters")
+    parser.add_argument("--threshold", type=float, default=FUZZY_THRESHOLD,
+                        help=f"n-gram Jaccard similarity for fuzzy matches (default {FUZZY_THRESHOLD})")
+    args = parser.parse_args()
+
+    # Imported here: data_access canonicalizes through this module
+    from data_access import load_masters
+    frames = list(load_masters(columns=['state', 'district', 'pincode'], cleaned_dir=CLEANED_DIR,
+                               report=False).values())
+    if not frames:
+        print("No masters found; run 01-03 first.")
+        return
+
+    dictionary, pincodes, fuzzy = build_dictionary(frames, args.threshold)
+    save_dictionary(dictionary, pincodes, CLEANED_DIR)
+    # Canonical names get their district keys here, so the analysis stages only read them
+    from cube import key_canonical_districts
+    key_canonical_districts(pd.concat([f[['state', 'district']] for f in frames], ignore_index=True), CLEANED_DIR)
+
+    n_canonical = dictionary['geo_id'].nunique()
+    print(f"\n{len(dictionary)} raw state/district variants -> {n_canonical} canonical districts")
+    for canon, raw, score in fuzzy:
+        print(f"  [FUZZY] '{raw}' -> '{canon}' (similarity {score:.2f})")
+
+    conflicts = pincodes[pincodes['districts'] > 1]
+    print(f"Pincodes mapped to more than one district: {len(conflicts)} of {len(pincodes)}")
+    if len(conflicts):
+        print(conflicts.sort_values('share').head(10).to_string(index=False))
+    print(f"Saved {DICTIONARY_FILE} and {PINCODE_FILE} to {CLEANED_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import json
+import os
+
+# Row-count ledger written by 01/02/03 (and fused_ingest) as they run, so
+# cleaning_report.py never has to re-read raw or cleaned files to explain drops.
+#   files:      "<folder>/<file stem>" -> raw_rows, rows_in, duplicates,
+#               missing_geography, all_nan_metrics, rows_out, cross_file_overlap
+#   categories: "<folder>" -> files, rows_in, cross_file_overlap, master_rows
+LEDGER_FILE = "lineage.json"
+SECTIONS = ["files", "categories"]
+
+def file_key(folder, filename):
+    """Same <folder>/<stem> form as the manifest, always under the cleaned folder name"""
+    return f"{folder}/{os.path.splitext(os.path.basename(filename))[0]}"
+
+def empty_lineage():
+    return {section: {} for section in SECTIONS}
+
+def merge_lineage(ledger, update):
+    """Fold one stage's counts into the ledger; later stages add fields, reruns overwrite them"""
+    if not update:
+        return ledger
+    for section in SECTIONS:
+        for key, counts in update.get(section, {}).items():
+            ledger[section].setdefault(key, {}).update(counts)
+    return ledger
+
+def load_ledger(directory):
+    path = os.path.join(directory, LEDGER_FILE)
+    ledger = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            ledger = json.load(f)
+    for section in SECTIONS:
+        ledger.setdefault(section, {})
+    return ledger
+
+def save_ledger(ledger, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, LEDGER_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(ledger, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
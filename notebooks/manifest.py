@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+# Manifest of every raw file, cleaned file and master the pipeline has processed.
+# Stages compare a file's content hash with its entry and skip work whose inputs
+# have not changed, so a new daily drop only re-processes its own category.
+MANIFEST_FILE = "manifest.json"
+SECTIONS = ["raw", "cleaned", "masters"]
+# Held by every stage that writes cleaned_data (01/02/03, fused ingest, 03 --compact)
+LOCK_FILE = "pipeline.lock"
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def fingerprint(path, previous=None):
+    """
+    Content hash of path. If size and mtime still match the previous entry the
+    recorded hash is reused instead of re-reading the file.
+    """
+    st = os.stat(path)
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        return previous["hash"]
+    return file_hash(path)
+
+def describe_file(path, rows=None, columns=None, file_hash_value=None):
+    """Manifest entry for path: file name, content hash, size/mtime (for the fast path), rows and schema"""
+    st = os.stat(path)
+    return {
+        "file": os.path.basename(path),
+        "hash": file_hash_value or file_hash(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "rows": rows,
+        "columns": list(columns) if columns is not None else None
+    }
+
+def manifest_key(path):
+    """Entries are keyed by <folder>/<file stem> so a format switch keeps the same key"""
+    folder = os.path.basename(os.path.dirname(path))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{folder}/{stem}"
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+    for section in SECTIONS:
+        manifest.setdefault(section, {})
+    return manifest
+
+def save_manifest(manifest, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+@contextmanager
+def pipeline_lock(directory, holder):
+    """
+    Hold directory/pipeline.lock for the duration of the block. If another stage
+    or a background compaction holds it the run stops instead of racing it on the
+    same files. A lock left behind by a killed run has to be deleted by hand.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, LOCK_FILE)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            with open(path) as f:
+                owner = f.read().strip()
+        except OSError:
+            owner = "another run"
+        raise SystemExit(f"[LOCKED] {owner} is writing to {directory}; "
+                         f"run again when it has finished (or delete {path} if it was killed)")
+    with os.fdopen(fd, "w") as f:
+        f.write(f"{holder} (pid {os.getpid()})")
+    try:
+        yield path
+    finally:
+        os.remove(path)
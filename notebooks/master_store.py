@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import shutil
+import uuid
+from urllib.parse import quote
+import pandas as pd
+from schema_registry import CATEGORY_SCHEMAS, GEO_CATEGORICAL, apply_schema, category_for_path
+from storage import find_table, read_table, table_columns
+from column_store import load_store
+from frame_cache import cached_read
+
+# Partitioned copy of the masters: cleaned_data/masters/<category>/state=<s>/month=<YYYY-MM>/*.parquet
+# _partitions.json holds row counts and min/max per partition, so a loader asking
+# for some states or a date range opens only the partitions that can match, and
+# Parquet projection reads only the requested columns.
+# 03 --append adds new rows as extra sorted "seg-" files in the partitions they
+# touch; compaction later folds each partition back into one sorted file.
+DATASET_DIR = "masters"
+STATS_FILE = "_partitions.json"
+NO_MONTH = "unknown"
+
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+
+def dataset_dir(cleaned_dir, category):
+    return os.path.join(cleaned_dir, DATASET_DIR, category)
+
+def partition_stats(cleaned_dir, category):
+    """Partition statistics of a category's dataset, or None if it hasn't been written"""
+    path = os.path.join(dataset_dir(cleaned_dir, category), STATS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def column_range(series):
+    """JSON-safe (min, max) of a column, or None if it's empty/all-missing"""
+    values = series.dropna()
+    if len(values) == 0:
+        return None
+    lo, hi = values.min(), values.max()
+    if isinstance(lo, pd.Timestamp):
+        return lo.isoformat(), hi.isoformat()
+    if isinstance(lo, str):
+        return lo, hi
+    return float(lo), float(hi)
+
+def partition_key(state, month):
+    return os.path.join(f"state={quote(str(state), safe='')}", f"month={month}")
+
+def partition_months(df):
+    if 'date' in df.columns:
+        return df['date'].dt.strftime('%Y-%m').fillna(NO_MONTH)
+    return pd.Series(NO_MONTH, index=df.index)
+
+class PartitionWriter:
+    """
+    Write a master (whole or in sorted batches) as a state/month partitioned dataset.
+    With append=True the existing dataset is kept and new files are added as segments.
+    """
+
+    def __init__(self, cleaned_dir, category, append=False):
+        self.root = dataset_dir(cleaned_dir, category)
+        self.prefix = "seg" if append else "part"
+        self.partitions = partition_stats(cleaned_dir, category) if append else None
+        if self.partitions is None:
+            if os.path.exists(self.root):
+                shutil.rmtree(self.root)
+            os.makedirs(self.root)
+            self.partitions = {}
+
+    def write(self, df):
+        months = partition_months(df)
+        # Per-file categoricals would disagree across files; store plain strings
+        df = df.astype({c: object for c in GEO_CATEGORICAL if c in df.columns})
+
+        for (state, month), part in df.groupby([df['state'], months], sort=False):
+            rel = partition_key(state, month)
+            os.makedirs(os.path.join(self.root, rel), exist_ok=True)
+            filename = os.path.join(rel, f"{self.prefix}-{uuid.uuid4().hex[:12]}.parquet")
+            part.to_parquet(os.path.join(self.root, filename), index=False)
+
+            entry = self.partitions.setdefault(rel, {"state": state, "month": month, "rows": 0,
+                                                     "files": [], "min": {}, "max": {}})
+            entry["rows"] += len(part)
+            entry["files"].append(filename)
+            for col in part.columns:
+                if col in GEO_CATEGORICAL:
+                    continue
+                bounds = column_range(part[col])
+                if bounds is None:
+                    continue
+                lo, hi = bounds
+                entry["min"][col] = min(lo, entry["min"].get(col, lo))
+                entry["max"][col] = max(hi, entry["max"].get(col, hi))
+
+    def close(self):
+        save_stats(self.root, self.partitions)
+        return self.root
+
+def save_stats(root, partitions):
+    path = os.path.join(root, STATS_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(partitions, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def read_partition(root, entry, columns=None, filters=None):
+    """All rows of one partition (every part and segment file), or those matching Parquet filters"""
+    return pd.concat([pd.read_parquet(os.path.join(root, f), columns=columns, filters=filters)
+                      for f in entry["files"]], ignore_index=True)
+
+def delta_filters(df):
+    """
+    Parquet filters for the rows on one of df's districts and one of its dates, so
+    only those are read back. A column with missing values in df isn't filtered on.
+    """
+    filters = []
+    if 'district' in df.columns and df['district'].notna().all():
+        filters.append(('district', 'in', sorted(df['district'].astype(str).unique())))
+    if 'date' in df.columns and df['date'].notna().all():
+        filters.append(('date', 'in', sorted(df['date'].unique())))
+    return filters or None
+
+def compact_partitions(cleaned_dir, category):
+    """
+    Fold every partition with more than one file into a single file sorted by
+    (district, date). Returns the number of partitions compacted.
+    """
+    root = dataset_dir(cleaned_dir, category)
+    partitions = partition_stats(cleaned_dir, category)
+    if not partitions:
+        return 0
+
+    compacted = 0
+    for rel, entry in partitions.items():
+        if len(entry["files"]) < 2:
+            continue
+        df = read_partition(root, entry)
+        sort_cols = [c for c in ['district', 'date'] if c in df.columns]
+        df = df.sort_values(sort_cols, kind='mergesort')
+        filename = os.path.join(rel, f"part-{uuid.uuid4().hex[:12]}.parquet")
+        df.to_parquet(os.path.join(root, filename), index=False)
+
+        old = entry["files"]
+        entry["files"] = [filename]
+        # Stats first, so a reader never sees a file list pointing at deleted files
+        save_stats(root, partitions)
+        for f in old:
+            os.remove(os.path.join(root, f))
+        compacted += 1
+    return compacted
+
+def segment_count(partitions):
+    return sum(os.path.basename(f).startswith("seg-") for e in partitions.values() for f in e["files"])
+
+def remove_partitioned(cleaned_dir, category):
+    """Drop a category's dataset (called when its master is rebuilt without one, so it can't go stale)"""
+    root = dataset_dir(cleaned_dir, category)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+
+def write_partitioned(df, cleaned_dir, category):
+    writer = PartitionWriter(cleaned_dir, category)
+    writer.write(df)
+    return writer.close(), len(writer.partitions)
+
+def select_partitions(partitions, states=None, start=None, end=None):
+    """Partitions whose state and date min/max can satisfy the filters"""
+    selected = []
+    for entry in partitions.values():
+        if states is not None and entry["state"] not in states:
+            continue
+        if (start is not None or end is not None) and "date" in entry["min"]:
+            if start is not None and pd.Timestamp(entry["max"]["date"]) < start:
+                continue
+            if end is not None and pd.Timestamp(entry["min"]["date"]) > end:
+                continue
+        selected.append(entry)
+    return selected
+
+def filter_rows(df, states=None, start=None, end=None):
+    mask = pd.Series(True, index=df.index)
+    if states is not None:
+        mask &= df['state'].isin(states)
+    if start is not None:
+        mask &= df['date'] >= start
+    if end is not None:
+        mask &= df['date'] <= end
+    return df[mask]
+
+def load_master(path, columns=None, states=None, start=None, end=None, report=False, cache=True):
+    """
+    Drop-in for read_table() on a master. Sources, fastest first: the up-to-date
+    memory-mapped column store (column_store.py), the partitioned dataset (only
+    matching partitions and requested columns), the master file (a CSV master is
+    parsed once into the frame cache unless cache=False).
+    states/start/end filter rows (dates inclusive).
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    category = category_for_path(path)
+    cleaned_dir = os.path.dirname(path)
+    partitions = partition_stats(cleaned_dir, category) if category else None
+
+    # Filter columns are read too, then dropped if they weren't asked for
+    filter_cols = (['state'] if states is not None else []) + \
+                  (['date'] if start is not None or end is not None else [])
+    read_cols = None if columns is None else list(dict.fromkeys(list(columns) + filter_cols))
+
+    store = load_store(cleaned_dir, category, read_cols) if category else None
+    if store is not None:
+        df = store
+        if report:
+            print(f"  Memory-mapped column store ({category}): {len(df)} rows, {len(df.columns)} columns")
+    elif not partitions:
+        df = cached_read(path, columns=read_cols, report=report) if cache else \
+            read_table(path, columns=read_cols, report=report)
+    else:
+        selected = select_partitions(partitions, states, start, end)
+        if states is not None or start is not None or end is not None:
+            print(f"  Partitions: reading {len(selected)} of {len(partitions)}")
+        root = dataset_dir(cleaned_dir, category)
+        files = [os.path.join(root, f) for entry in selected for f in entry["files"]]
+        # An empty selection still returns the right columns
+        schema_file = files[0] if files else os.path.join(root, next(iter(partitions.values()))["files"][0])
+        if read_cols is not None:
+            available = table_columns(schema_file)
+            read_cols = [c for c in read_cols if c in available]
+        if files:
+            df = pd.concat([pd.read_parquet(f, columns=read_cols) for f in files], ignore_index=True)
+        else:
+            df = pd.read_parquet(schema_file, columns=read_cols).iloc[0:0]
+        df = apply_schema(df, category, report=report, label=os.path.basename(root))
+
+    if filter_cols:
+        df = filter_rows(df, states, start, end)
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+    return df
+
+def partition_masters(cleaned_dir):
+    """(Re)write the partitioned dataset of every master that exists"""
+    for category, schema in CATEGORY_SCHEMAS.items():
+        path = find_table(os.path.join(cleaned_dir, schema["master"]))
+        if path:
+            root, n = write_partitioned(read_table(path), cleaned_dir, category)
+            print(f"  [PARTITIONED] {root} ({n} partitions)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioned master datasets")
+    parser.parse_args()
+    partition_masters(CLEANED_DIR)
+
+if __name__ == "__main__":
+    main()
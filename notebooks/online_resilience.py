@@ -0,0 +1,182 @@
+import os
+import numpy as np
+import pandas as pd
+from districts import KEY
+
+# Online resilience metrics: a fixed-size state per district, updated in O(1) per
+# new (district, day) observation instead of recomputing from the full history.
+# Per district: Welford count/mean/M2 (variance), running max, the last day seen
+# and a P-squared sketch of the median (Jain & Chlamtac, 1985: five markers whose
+# heights track the min, p/2, p, (1+p)/2 quantiles and max). Arrays are indexed
+# by district key and saved as cleaned_data/resilience_state.npz between runs.
+# Mean, std, peak and data points match the batch metrics exactly; the median
+# (and so shock intensity) is the sketch's estimate once a district has more than
+# five days. A day is only applied once per district: later revisions to a day
+# already seen are not picked up.
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+STATE_FILE = "resilience_state.npz"
+QUANTILE = 0.5
+MARKERS = 5
+NO_DAY = np.iinfo('int64').min
+
+# Desired marker positions start at these (0-based) and move by INCREMENTS per observation
+INITIAL_POSITIONS = np.array([0, 2 * QUANTILE, 4 * QUANTILE, 2 + 2 * QUANTILE, 4])
+INCREMENTS = np.array([0, QUANTILE / 2, QUANTILE, (1 + QUANTILE) / 2, 1])
+
+def to_days(dates):
+    return np.asarray(dates, dtype='datetime64[D]').astype('int64')
+
+class ResilienceState:
+    """Constant-size resilience state for every district key"""
+
+    FIELDS = ['count', 'mean', 'm2', 'peak', 'last_day', 'heights', 'positions', 'desired']
+
+    def __init__(self, size=0):
+        self.count = np.zeros(size, dtype='int64')
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.peak = np.full(size, -np.inf)
+        self.last_day = np.full(size, NO_DAY, dtype='int64')
+        # Marker heights hold the first observations until there are MARKERS of them
+        self.heights = np.zeros((size, MARKERS))
+        self.positions = np.zeros((size, MARKERS))
+        self.desired = np.zeros((size, MARKERS))
+
+    def __len__(self):
+        return len(self.count)
+
+    def grow(self, size):
+        """Make room for keys below size (new districts start empty)"""
+        if size <= len(self):
+            return
+        extra = ResilienceState(size - len(self))
+        for name in self.FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(extra, name)]))
+
+    def update(self, keys, volumes):
+        """Apply one observation to each of keys (distinct)"""
+        keys = np.asarray(keys, dtype='int64')
+        x = np.asarray(volumes, dtype='float64')
+
+        # Welford mean / M2, running max
+        count = self.count[keys] + 1
+        delta = x - self.mean[keys]
+        mean = self.mean[keys] + delta / count
+        self.m2[keys] += delta * (x - mean)
+        self.mean[keys] = mean
+        self.count[keys] = count
+        self.peak[keys] = np.maximum(self.peak[keys], x)
+
+        # Median sketch: buffer the first MARKERS observations, then start the markers from them
+        filling = count <= MARKERS
+        self.heights[keys[filling], count[filling] - 1] = x[filling]
+        starting = keys[count == MARKERS]
+        self.heights[starting] = np.sort(self.heights[starting], axis=1)
+        self.positions[starting] = np.arange(MARKERS)
+        self.desired[starting] = INITIAL_POSITIONS
+
+        streaming = count > MARKERS
+        if streaming.any():
+            self.update_markers(keys[streaming], x[streaming])
+
+    def update_markers(self, keys, x):
+        q = self.heights[keys]
+        n = self.positions[keys]
+        rows = np.arange(len(keys))
+
+        # Cell of x among the markers (the extremes move to take it in)
+        q[:, 0] = np.minimum(q[:, 0], x)
+        q[:, 4] = np.maximum(q[:, 4], x)
+        cell = np.clip((x[:, None] >= q[:, 1:4]).sum(axis=1), 0, 3)
+        n += np.arange(MARKERS)[None, :] > cell[:, None]
+        desired = self.desired[keys] + INCREMENTS
+
+        # Move the middle markers one position towards where they should be
+        for i in (1, 2, 3):
+            d = desired[:, i] - n[:, i]
+            move = ((d >= 1) & (n[:, i + 1] - n[:, i] > 1)) | ((d <= -1) & (n[:, i - 1] - n[:, i] < -1))
+            step = np.sign(d) * move
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parabolic = q[:, i] + step / (n[:, i + 1] - n[:, i - 1]) * (
+                    (n[:, i] - n[:, i - 1] + step) * (q[:, i + 1] - q[:, i]) / (n[:, i + 1] - n[:, i]) +
+                    (n[:, i + 1] - n[:, i] - step) * (q[:, i] - q[:, i - 1]) / (n[:, i] - n[:, i - 1]))
+                neighbour = i + step.astype('int64')
+                linear = q[:, i] + step * (q[rows, neighbour] - q[:, i]) / (n[rows, neighbour] - n[:, i])
+            inside = (q[:, i - 1] < parabolic) & (parabolic < q[:, i + 1])
+            q[:, i] = np.where(move, np.where(inside, parabolic, linear), q[:, i])
+            n[:, i] += step
+
+        self.heights[keys] = q
+        self.positions[keys] = n
+        self.desired[keys] = desired
+
+    def add(self, keys, dates, volumes):
+        """
+        Apply (district key, date, volume) observations in date order, skipping days
+        a district has already had. Returns how many were applied.
+        """
+        keys = np.asarray(keys, dtype='int64')
+        days = to_days(dates)
+        volumes = np.asarray(volumes, dtype='float64')
+        self.grow(int(keys.max(initial=-1)) + 1)
+
+        new = days > self.last_day[keys]
+        keys, days, volumes = keys[new], days[new], volumes[new]
+        order = np.argsort(days, kind='stable')
+        keys, days, volumes = keys[order], days[order], volumes[order]
+
+        # One vectorized update per day (a district has at most one observation per day)
+        bounds = np.r_[0, np.flatnonzero(np.diff(days)) + 1, len(days)] if len(days) else []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            self.update(keys[start:end], volumes[start:end])
+            self.last_day[keys[start:end]] = days[start]
+        return len(keys)
+
+    def median(self):
+        """Sketch estimate of each district's median (exact while it has at most MARKERS days)"""
+        # Buffered values sorted with the unused slots (NaN) last, then the middle one(s)
+        buffered = np.sort(np.where(np.arange(MARKERS)[None, :] < self.count[:, None], self.heights, np.nan), axis=1)
+        count = np.clip(self.count, 1, MARKERS)
+        rows = np.arange(len(self))
+        exact = (buffered[rows, (count - 1) // 2] + buffered[rows, count // 2]) / 2
+        return np.where(self.count > MARKERS, self.heights[:, 2], np.where(self.count > 0, exact, np.nan))
+
+    def metrics(self, min_points=10):
+        """Current metrics of districts with at least min_points days, keyed by district"""
+        seen = np.flatnonzero(self.count >= min_points)
+        count = self.count[seen]
+        mean = self.mean[seen]
+        median = self.median()[seen]
+        peak = self.peak[seen]
+        std = np.sqrt(self.m2[seen] / count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shock_intensity = np.where(median > 0, peak / median, 0)
+            volatility_score = np.where(mean > 0, std / mean * 100, 0)
+        return pd.DataFrame({
+            KEY: seen.astype('int32'),
+            'median_daily_volume': median,
+            'peak_daily_volume': peak,
+            'shock_intensity': shock_intensity,
+            'volatility_score': volatility_score,
+            'stability_score': np.maximum(0, 100 - volatility_score),
+            'data_points': count,
+            'last_date': self.last_day[seen].astype('datetime64[D]')
+        })
+
+    def save(self, cleaned_dir=CLEANED_DIR):
+        path = os.path.join(cleaned_dir, STATE_FILE)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.FIELDS})
+        os.replace(path + ".tmp", path)
+        return path
+
+    @classmethod
+    def load(cls, cleaned_dir=CLEANED_DIR):
+        """The saved state, or an empty one if there is none yet"""
+        state = cls()
+        path = os.path.join(cleaned_dir, STATE_FILE)
+        if os.path.exists(path):
+            with np.load(path) as saved:
+                for name in cls.FIELDS:
+                    setattr(state, name, saved[name])
+        return state
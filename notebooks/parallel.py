@@ -0,0 +1,26 @@
+import io
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+def capture_output(func, args):
+    """Run func(*args) and return (printed log, result)"""
+    buf = io.StringIO()
+    with redirect_stdout(buf):
+        result = func(*args)
+    return buf.getvalue(), result
+
+def run_tasks(func, arg_list, workers=1):
+    """
+    Run func over each tuple in arg_list, yielding (log, result) in input order.
+    With workers > 1 the calls are spread over a process pool; logs are still
+    yielded in submission order so console output stays deterministic.
+    """
+    if workers <= 1:
+        for args in arg_list:
+            yield capture_output(func, args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(capture_output, func, args) for args in arg_list]
+        for future in futures:
+            yield future.result()
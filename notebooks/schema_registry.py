@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pandas as pd
+from date_parsing import parse_dates
+
+# Central schema for every category the pipeline handles.
+# Key: cleaned_data subfolder; "master" is the merged file written by 03.
+CATEGORY_SCHEMAS = {
+    "enrolment": {
+        "label": "Enrolment",
+        "master": "enrolment_master.csv",
+        "metrics": ["age_0_5", "age_5_17", "age_18_plus"]
+    },
+    "demographic_updates": {
+        "label": "Demographic",
+        "master": "demographic_master.csv",
+        "metrics": ["age_5_17", "age_18_plus"]
+    },
+    "biometric_updates": {
+        "label": "Biometric",
+        "master": "biometric_master.csv",
+        "metrics": ["age_5_17", "age_18_plus"]
+    }
+}
+
+# Column dtypes shared by all categories.
+# state/district repeat a few hundred values millions of times -> categorical.
+# Counts are nullable so the NaNs from pd.to_numeric(errors='coerce') don't force float64.
+GEO_CATEGORICAL = ['state', 'district']
+PINCODE_DTYPE = 'int32'
+COUNT_DTYPE = 'Int32'
+ALL_METRICS = ["age_0_5", "age_5_17", "age_18_plus"]
+
+def category_for_label(label):
+    """Map a display name ("Enrolment", "Demographic", ...) to its registry key"""
+    for category, schema in CATEGORY_SCHEMAS.items():
+        if schema["label"] == label:
+            return category
+    return None
+
+def category_for_path(path):
+    """Infer the category of a cleaned file or master from where it lives / what it's called"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parent = os.path.basename(os.path.dirname(path))
+    for category, schema in CATEGORY_SCHEMAS.items():
+        if parent == category or stem == os.path.splitext(schema["master"])[0]:
+            return category
+    return None
+
+def schema_dtypes(category):
+    """Declared dtype of every column of a category"""
+    dtypes = {'date': 'datetime64[ns]'}
+    dtypes.update({c: 'category' for c in GEO_CATEGORICAL})
+    dtypes['pincode'] = PINCODE_DTYPE
+    dtypes.update({c: COUNT_DTYPE for c in CATEGORY_SCHEMAS[category]["metrics"]})
+    return dtypes
+
+def to_count(series):
+    """Coerce to numbers, then narrow to nullable Int32 when every value is a whole number"""
+    numeric = pd.to_numeric(series, errors='coerce')
+    values = numeric.dropna()
+    if len(values) and not (np.mod(values, 1) == 0).all():
+        return numeric.astype('float64')
+    if len(values) and values.abs().max() > np.iinfo('int32').max:
+        return numeric.astype('Int64')
+    return numeric.astype(COUNT_DTYPE)
+
+def to_pincode(series):
+    """int32 pincodes (nullable if missing). Non-numeric pincodes are left untouched for cleaning to see."""
+    numeric = pd.to_numeric(series, errors='coerce')
+    if numeric.isna().sum() > series.isna().sum():
+        return series
+    if numeric.isna().any():
+        return numeric.astype('Int32')
+    return numeric.astype(PINCODE_DTYPE)
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+def apply_schema(df, category=None, report=False, label=None):
+    """
+    Cast df to the registry dtypes (in place where possible) and return it.
+    Without a category, every known count column present is treated as a metric.
+    """
+    before = memory_mb(df) if report else None
+    metrics = CATEGORY_SCHEMAS[category]["metrics"] if category else ALL_METRICS
+
+    for col in GEO_CATEGORICAL:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    if 'pincode' in df.columns:
+        df['pincode'] = to_pincode(df['pincode'])
+    for col in metrics:
+        if col in df.columns:
+            df[col] = to_count(df[col])
+    if 'date' in df.columns:
+        df['date'] = parse_dates(df['date'])
+
+    if report:
+        after = memory_mb(df)
+        name = label or category or "frame"
+        print(f"  Memory ({name}): {before:,.1f} MB -> {after:,.1f} MB ({before / max(after, 1e-9):.1f}x smaller)")
+    return df
@@ -0,0 +1,63 @@
+import numpy as np
+
+# Reductions over sorted segments: rows ordered by a group key (e.g. one district's
+# daily series after another) are reduced per group with ufunc.reduceat and index
+# arithmetic over the whole array, instead of a Python loop over the groups.
+
+class Segments:
+    """Contiguous groups of a key array that is sorted (or at least grouped)"""
+
+    def __init__(self, keys):
+        keys = np.asarray(keys)
+        self.n = len(keys)
+        change = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        self.starts = np.r_[0, change] if self.n else np.empty(0, dtype='int64')
+        self.ends = np.r_[change, self.n] if self.n else np.empty(0, dtype='int64')
+        self.counts = self.ends - self.starts
+        self.keys = keys[self.starts]
+        self.ids = np.repeat(np.arange(len(self.starts)), self.counts)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def sum(self, values):
+        return np.add.reduceat(values, self.starts) if self.n else np.empty(0)
+
+    def max(self, values):
+        return np.maximum.reduceat(values, self.starts) if self.n else np.empty(0)
+
+    def mean(self, values):
+        return self.sum(values) / self.counts
+
+    def std(self, values, mean=None):
+        """Population standard deviation (ddof=0, as np.std), from deviations about each segment's mean"""
+        mean = self.mean(values) if mean is None else mean
+        deviation = values - mean[self.ids]
+        return np.sqrt(self.sum(deviation * deviation) / self.counts)
+
+    def median(self, values):
+        """Per-segment median: one lexsort of (segment, value), then the middle element(s)"""
+        if not self.n:
+            return np.empty(0)
+        ordered = values[np.lexsort((values, self.ids))]
+        lower = ordered[self.starts + (self.counts - 1) // 2]
+        upper = ordered[self.starts + self.counts // 2]
+        return (lower + upper) / 2
+
+    def runs(self, flags):
+        """
+        Runs of consecutive True flags that stay inside one segment: (first row,
+        last row, segment, closed) arrays. closed is False for a run still going
+        at the end of its segment.
+        """
+        flags = np.asarray(flags, dtype=bool)
+        first = np.zeros(self.n, dtype=bool)
+        first[self.starts] = True
+        last = np.zeros(self.n, dtype=bool)
+        last[self.ends - 1] = True
+
+        previous = np.r_[False, flags[:-1]] & ~first
+        following = np.r_[flags[1:], False] & ~last
+        run_first = np.flatnonzero(flags & ~previous)
+        run_last = np.flatnonzero(flags & ~following)
+        return run_first, run_last, self.ids[run_first], ~last[run_last]
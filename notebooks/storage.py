@@ -0,0 +1,212 @@
+import argparse
+import glob
+import os
+import pandas as pd
+from date_parsing import parse_dates
+from manifest import MANIFEST_FILE, load_manifest, manifest_key
+from schema_registry import CATEGORY_SCHEMAS, apply_schema, category_for_path
+
+CLEANED_DIR = r"d:/UIDAI data hackathon/cleaned_data"
+
+# On-disk formats for the cleaned files and masters.
+# Parquet (needs pyarrow) is columnar: downstream stages read only the columns they use
+# and dates/counts come back typed instead of being re-tokenised from text.
+FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet"
+}
+DEFAULT_FORMAT = "csv"
+
+# CSV copies of Parquet tables go to their own folder, mirroring the cleaned layout,
+# so they never shadow (or get deleted as stale copies of) the tables themselves
+EXPORT_DIR = "csv_export"
+
+def table_path(path, fmt):
+    """Swap the extension of path for the one used by fmt"""
+    return os.path.splitext(path)[0] + FORMATS[fmt]
+
+def table_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError(f"Unknown table format: {path}")
+
+def recorded_format(path):
+    """
+    The format the manifest says the table at path was last written in, or None.
+    Cleaned files are looked up under their folder/stem key, masters by file stem.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for directory in [os.path.dirname(path), os.path.dirname(os.path.dirname(path))]:
+        if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            continue
+        manifest = load_manifest(directory)
+        entries = [manifest["cleaned"].get(manifest_key(path))]
+        entries += [e for e in manifest["masters"].values() if os.path.splitext(e.get("file", ""))[0] == stem]
+        for entry in entries:
+            if entry and entry.get("file"):
+                return table_format(entry["file"])
+        return None
+    return None
+
+def find_table(path):
+    """
+    Resolve a logical table path (extension ignored) to the file on disk.
+    If the table exists in several formats, the one the manifest recorded as
+    last written wins (the most recent file if there is no record).
+    """
+    candidates = [table_path(path, fmt) for fmt in FORMATS]
+    existing = [p for p in candidates if os.path.exists(p)]
+    if len(existing) <= 1:
+        return existing[0] if existing else None
+    recorded = recorded_format(path)
+    if recorded is not None and table_path(path, recorded) in existing:
+        return table_path(path, recorded)
+    return max(existing, key=os.path.getmtime)
+
+def list_tables(directory):
+    """All tables in a directory, one path per stem, sorted by name"""
+    stems = {}
+    for fmt, ext in FORMATS.items():
+        for p in glob.glob(os.path.join(directory, "*" + ext)):
+            stems.setdefault(os.path.splitext(p)[0], p)
+    return sorted(find_table(p) for p in stems.values())
+
+def table_columns(path):
+    path = find_table(path)
+    if table_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def read_table(path, columns=None, category=None, report=False):
+    """
+    Read a table in whichever format it was stored, projecting to `columns`
+    (requested columns the table lacks are skipped). 'date' is always datetime64.
+    Tables of a known category (inferred from the path if not given) are cast
+    to the registry dtypes; report=True prints the memory saved.
+    """
+    logical_path = path
+    path = find_table(path)
+    if path is None:
+        raise FileNotFoundError(logical_path)
+
+    if columns is not None:
+        available = table_columns(path)
+        columns = [c for c in columns if c in available]
+
+    if table_format(path) == "parquet":
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=columns, low_memory=False)
+
+    category = category or category_for_path(path)
+    if category:
+        return apply_schema(df, category, report=report, label=os.path.basename(path))
+    if 'date' in df.columns:
+        df['date'] = parse_dates(df['date'])
+    return df
+
+def iter_table(path, chunk_size, columns=None, category=None):
+    """read_table() in chunks of at most chunk_size rows, each typed the same way"""
+    logical_path = path
+    path = find_table(path)
+    if path is None:
+        raise FileNotFoundError(logical_path)
+    category = category or category_for_path(path)
+
+    if table_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in
+                  pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns))
+    else:
+        chunks = pd.read_csv(path, usecols=columns, chunksize=chunk_size, low_memory=False)
+
+    for df in chunks:
+        if category:
+            df = apply_schema(df, category)
+        elif 'date' in df.columns:
+            df['date'] = parse_dates(df['date'])
+        yield df
+
+def write_table(df, path, fmt=DEFAULT_FORMAT):
+    """Write df as fmt next to path (extension replaced). Returns the written path."""
+    out = table_path(path, fmt)
+    if fmt == "parquet":
+        df.to_parquet(out, index=False)
+    else:
+        df.to_csv(out, index=False)
+
+    # Drop the other-format copy so readers never pick up stale data
+    for other in FORMATS:
+        stale = table_path(path, other)
+        if other != fmt and os.path.exists(stale):
+            os.remove(stale)
+    return out
+
+class ChunkWriter:
+    """Append DataFrame chunks to one table, in CSV or Parquet"""
+
+    def __init__(self, path, fmt=DEFAULT_FORMAT):
+        self.path = table_path(path, fmt)
+        self.fmt = fmt
+        self.writer = None
+        self.chunks = 0
+
+    def write(self, df):
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.path, index=False, mode='w' if self.chunks == 0 else 'a', header=(self.chunks == 0))
+        self.chunks += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        for other in FORMATS:
+            stale = table_path(self.path, other)
+            if other != self.fmt and os.path.exists(stale):
+                os.remove(stale)
+        return self.path
+
+def export_csv(directory):
+    """
+    Write a CSV copy of every Parquet cleaned file and master under
+    directory/EXPORT_DIR (same relative paths). Other artifacts are not exported.
+    """
+    tables = []
+    for category, schema in CATEGORY_SCHEMAS.items():
+        tables += list_tables(os.path.join(directory, category))
+        master = find_table(os.path.join(directory, schema["master"]))
+        if master:
+            tables.append(master)
+
+    for path in tables:
+        if table_format(path) != "parquet":
+            continue
+        out = table_path(os.path.join(directory, EXPORT_DIR, os.path.relpath(path, directory)), "csv")
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        pd.read_parquet(path).to_csv(out, index=False)
+        print(f"  [EXPORTED] {out}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cleaned-data storage utilities")
+    parser.add_argument("--export-csv", action="store_true",
+                        help=f"Export the Parquet cleaned files and masters as CSV under <cleaned data>/{EXPORT_DIR}")
+    args = parser.parse_args()
+
+    if args.export_csv:
+        export_csv(CLEANED_DIR)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()